@@ -6,80 +6,96 @@ import argparse
 from collections import defaultdict
 from datetime import datetime
 
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
 
-def load_filter_stats(log_path):
-    """从 JSONL 文件加载过滤统计数据"""
-    records = []
+
+def stream_filter_stats(log_path):
+    """从 JSONL 文件逐条产出过滤统计记录（不在内存中保留全部记录）"""
     if not os.path.exists(log_path):
         print(f"Warning: Filter stats file not found: {log_path}")
-        return records
+        return
     
-    with open(log_path, "r", encoding="utf-8") as f:
+    # 以二进制模式读取，orjson 可直接解析 bytes，省去 UTF-8 解码；
+    # 使用 1MB 缓冲区减少大文件读取时的系统调用次数
+    with open(log_path, "rb", buffering=1 << 20) as f:
         for line in f:
             if not line.strip():
                 continue
             try:
-                record = json.loads(line)
-                records.append(record)
+                yield _json.loads(line)
             except json.JSONDecodeError as e:
                 print(f"Warning: Failed to parse line: {e}")
-    
-    return records
 
 
 def analyze_stats(records):
-    """分析过滤统计数据"""
-    if not records:
-        return None
-    
+    """分析过滤统计数据（单次遍历，records 可以是任意可迭代对象）"""
     # 聚合统计
-    total_generated = sum(r.get("total_generated", 0) for r in records)
-    total_accepted = sum(r.get("total_accepted", 0) for r in records)
-    total_rejected = sum(r.get("total_rejected", 0) for r in records)
+    num_records = 0
+    total_generated = 0
+    total_accepted = 0
+    total_rejected = 0
     
     # 按拒绝原因聚合
     rejection_reasons = defaultdict(int)
+    
+    # 按合约统计（注意：合约地址可能是测试部署地址，不是唯一的）
+    # 值为 [generated, accepted, rejected]
+    per_contract = defaultdict(lambda: [0, 0, 0])
+    
     for r in records:
-        reasons = r.get("rejection_reasons", {})
-        for reason, count in reasons.items():
+        num_records += 1
+        g = r.get("total_generated", 0)
+        a = r.get("total_accepted", 0)
+        j = r.get("total_rejected", 0)
+        total_generated += g
+        total_accepted += a
+        total_rejected += j
+        
+        for reason, count in r.get("rejection_reasons", {}).items():
             rejection_reasons[reason] += count
+        
+        triple = per_contract[r.get("contract", "unknown")]
+        triple[0] += g
+        triple[1] += a
+        triple[2] += j
+    
+    if not num_records:
+        return None
     
     # 计算比例
     filter_rate = (total_rejected / total_generated * 100) if total_generated > 0 else 0.0
     
-    # 拒绝原因分布（占被拒绝总数的比例）
-    reason_distribution = {}
+    # 拒绝原因分布（占被拒绝总数的比例），按数量降序排列的 (原因, 统计) 列表
+    reason_distribution = []
     if total_rejected > 0:
-        for reason, count in rejection_reasons.items():
-            reason_distribution[reason] = {
+        for reason, count in sorted(rejection_reasons.items(), key=lambda x: x[1], reverse=True):
+            reason_distribution.append((reason, {
                 "count": count,
                 "percent_of_rejected": round(count / total_rejected * 100, 2),
                 "percent_of_total": round(count / total_generated * 100, 2)
-            }
-    
-    # 按合约统计（注意：合约地址可能是测试部署地址，不是唯一的）
-    per_contract_stats = {}
-    for r in records:
-        contract = r.get("contract", "unknown")
-        if contract not in per_contract_stats:
-            per_contract_stats[contract] = {
-                "total_generated": 0,
-                "total_accepted": 0,
-                "total_rejected": 0
-            }
-        per_contract_stats[contract]["total_generated"] += r.get("total_generated", 0)
-        per_contract_stats[contract]["total_accepted"] += r.get("total_accepted", 0)
-        per_contract_stats[contract]["total_rejected"] += r.get("total_rejected", 0)
+            }))
+    
+    per_contract_stats = {
+        contract: {
+            "total_generated": g,
+            "total_accepted": a,
+            "total_rejected": j
+        }
+        for contract, (g, a, j) in per_contract.items()
+    }
     
     # 注意：由于合约地址是测试部署地址，实际合约数量应该看records数量
     # 每个record代表一次LLM会话结束时的统计
-    num_llm_sessions = len(records)
+    num_llm_sessions = num_records
     
     return {
         "summary": {
             "total_contracts": len(per_contract_stats),  # 唯一合约地址数（可能为1）
             "total_llm_sessions": num_llm_sessions,      # LLM 会话数（更有意义）
-            "total_records": len(records),
+            "total_records": num_records,
             "total_generated": total_generated,
             "total_accepted": total_accepted,
             "total_rejected": total_rejected,
@@ -119,9 +135,8 @@ def generate_text_report(analysis):
         "-" * 40,
     ]
     
-    rd = analysis.get("reason_distribution", {})
-    # 按数量排序
-    sorted_reasons = sorted(rd.items(), key=lambda x: x[1]["count"], reverse=True)
+    # analyze_stats 已按数量降序排列
+    sorted_reasons = analysis.get("reason_distribution", [])
     
     # 映射原因名称为中文
     reason_names = {
@@ -170,14 +185,13 @@ def main():
         output_dir = os.path.join(project_root, output_dir)
     
     print(f"正在加载过滤统计数据: {log_path}")
-    records = load_filter_stats(log_path)
-    print(f"已加载 {len(records)} 条记录")
-    
-    analysis = analyze_stats(records)
+    analysis = analyze_stats(stream_filter_stats(log_path))
     
     if not analysis:
+        print("已加载 0 条记录")
         print("无可分析数据。请先运行实验。")
         return
+    print(f"已加载 {analysis['summary']['total_records']} 条记录")
     
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
@@ -185,7 +199,8 @@ def main():
     # 保存 JSON 报告
     json_path = os.path.join(output_dir, "filter_analysis_report.json")
     with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(analysis, f, indent=2, ensure_ascii=False)
+        json.dump({**analysis, "reason_distribution": dict(analysis["reason_distribution"])},
+                  f, indent=2, ensure_ascii=False)
     print(f"JSON报告已保存至: {json_path}")
     
     # 保存文本报告
@@ -4,13 +4,13 @@
 
 import os
 import json
-import csv
 import argparse
 import numpy as np
+import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
-from collections import defaultdict
 
 # 可选: scipy 用于统计检验
 try:
@@ -21,6 +21,31 @@ except ImportError:
     print("[警告] 未安装scipy。将跳过统计显著性检验。")
     print("         安装命令: pip install scipy")
 
+# 可选: orjson 用于加速 results.json 解析
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _loads(raw: bytes):
+    """解析 JSON 字节串；orjson 不接受 NaN/Infinity，遇到时退回标准库"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw)
+
+
+def _load_one(results_file: Path) -> Tuple[str, Optional[dict], Optional[Exception]]:
+    """读取单个 results.json，返回 (时间戳目录名, 数据, 异常)"""
+    try:
+        return results_file.parent.name, _loads(results_file.read_bytes()), None
+    except Exception as e:
+        return results_file.parent.name, None, e
+
 
 def load_all_runs(base_dir: str, source: str, dataset: str, config: str, mode: str) -> List[Tuple[str, dict]]:
     """
@@ -33,56 +58,38 @@ def load_all_runs(base_dir: str, source: str, dataset: str, config: str, mode: s
         print(f"[Warning] Directory not found for mode '{mode}': {mode_path}")
         return []
     
-    runs = []
     timestamp_dirs = sorted([d for d in mode_path.iterdir() if d.is_dir()])
+    results_files = [d / "results.json" for d in timestamp_dirs if (d / "results.json").is_file()]
+    if not results_files:
+        return []
+    
+    # 各次运行的文件相互独立，用线程池并行读取和解析
+    with ThreadPoolExecutor(max_workers=min(32, len(results_files))) as executor:
+        loaded = list(executor.map(_load_one, results_files))
     
-    for ts_dir in timestamp_dirs:
-        results_file = ts_dir / "results.json"
-        if results_file.is_file():
-            try:
-                with open(results_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                runs.append((ts_dir.name, data))
-                print(f"  [✓] Loaded: {ts_dir.name}")
-            except Exception as e:
-                print(f"  [✗] Failed to load {results_file}: {e}")
+    runs = []
+    for results_file, (name, data, error) in zip(results_files, loaded):
+        if error is None:
+            runs.append((name, data))
+            print(f"  [✓] Loaded: {name}")
+        else:
+            print(f"  [✗] Failed to load {results_file}: {error}")
     
     return runs
 
 
-def extract_metrics(contract_data: dict) -> dict:
-    """从单个合约的结果数据中提取关键指标"""
-    return {
-        'branch_coverage': contract_data.get('branch_coverage', {}).get('percentage', None),
-        'code_coverage': contract_data.get('code_coverage', {}).get('percentage', None),
-        'execution_time': contract_data.get('execution_time', None),
-        'transactions_total': contract_data.get('transactions', {}).get('total', None),
-        'transactions_per_sec': contract_data.get('transactions', {}).get('per_second', None),
-        'memory_consumption': contract_data.get('memory_consumption', None),
-    }
-
-
-def compute_statistics(values: List[float]) -> dict:
-    """为数值列表计算统计指标"""
-    valid_values = [v for v in values if v is not None and not np.isnan(v)]
-    
-    if not valid_values:
-        return {
-            'mean': None, 'std': None, 'variance': None,
-            'min': None, 'max': None, 'median': None,
-            'n_runs': 0
-        }
-    
-    arr = np.array(valid_values)
-    return {
-        'mean': float(np.mean(arr)),
-        'std': float(np.std(arr, ddof=1)) if len(arr) > 1 else 0.0,
-        'variance': float(np.var(arr, ddof=1)) if len(arr) > 1 else 0.0,
-        'min': float(np.min(arr)),
-        'max': float(np.max(arr)),
-        'median': float(np.median(arr)),
-        'n_runs': len(valid_values)
-    }
+# 从单个合约的结果数据中提取关键指标: (指标名, 取值函数)，缺失时取值为 None
+METRIC_GETTERS = (
+    ('branch_coverage', lambda d: d.get('branch_coverage', {}).get('percentage')),
+    ('code_coverage', lambda d: d.get('code_coverage', {}).get('percentage')),
+    ('execution_time', lambda d: d.get('execution_time')),
+    ('transactions_total', lambda d: d.get('transactions', {}).get('total')),
+    ('transactions_per_sec', lambda d: d.get('transactions', {}).get('per_second')),
+    ('memory_consumption', lambda d: d.get('memory_consumption')),
+)
+METRIC_NAMES = tuple(name for name, _ in METRIC_GETTERS)
+# 聚合时按位置索引指标，避免逐行存储和哈希指标名字符串
+_INDEXED_GETTERS = tuple(enumerate(get for _, get in METRIC_GETTERS))
 
 
 def aggregate_runs(runs: List[Tuple[str, dict]]) -> Dict[str, Dict[str, dict]]:
@@ -90,105 +97,143 @@ def aggregate_runs(runs: List[Tuple[str, dict]]) -> Dict[str, Dict[str, dict]]:
     将多次运行的指标聚合为每个合约的统计数据
     返回: {contract_path: {metric_name: {mean, std, variance, min, max, median, n_runs}}}
     """
-    # 首先，收集每个合约每个指标的所有数值
-    contract_metrics = defaultdict(lambda: defaultdict(list))
+    # 首先，将所有 (合约, 指标索引, 数值) 收集为扁平的行
+    rows = []
     
     for timestamp, results in runs:
         for contract_path, contract_data in results.items():
-            metrics = extract_metrics(contract_data)
-            for metric_name, value in metrics.items():
-                if value is not None:
-                    contract_metrics[contract_path][metric_name].append(value)
+            for metric_idx, get in _INDEXED_GETTERS:
+                value = get(contract_data)
+                # 在提取时过滤缺失值和 NaN (NaN != NaN)，聚合阶段无需再清洗
+                if value is not None and value == value:
+                    rows.append((contract_path, metric_idx, value))
+    
+    if not rows:
+        return {}
+    
+    # Then compute statistics for each (contract, metric) group in one groupby
+    # (方差由标准差平方得到，少一次遍历)
+    df = pd.DataFrame(rows, columns=['contract', 'metric', 'value'])
+    grouped = df.groupby(['contract', 'metric'], sort=False)['value'].agg(
+        ['mean', 'std', 'min', 'max', 'median', 'count']
+    )
     
-    # Then compute statistics for each
     aggregated = {}
-    for contract_path, metrics in contract_metrics.items():
-        aggregated[contract_path] = {}
-        for metric_name, values in metrics.items():
-            aggregated[contract_path][metric_name] = compute_statistics(values)
+    for (contract_path, metric_idx), mean, std, vmin, vmax, median, count in grouped.itertuples(name=None):
+        aggregated.setdefault(contract_path, {})[METRIC_NAMES[metric_idx]] = {
+            'mean': float(mean),
+            'std': float(std) if count > 1 else 0.0,
+            'variance': float(std) ** 2 if count > 1 else 0.0,
+            'min': float(vmin),
+            'max': float(vmax),
+            'median': float(median),
+            'n_runs': int(count)
+        }
     
     return aggregated
 
 
-def compute_overall_statistics(aggregated: Dict[str, Dict[str, dict]], metric_name: str) -> dict:
+def build_tidy_statistics(aggregated: Dict[str, Dict[str, dict]]) -> pd.DataFrame:
+    """
+    将聚合结果展平为 合约 × (指标, mean/std) 的表，缺失值为 NaN。
+    每种模式只构建一次，供总体统计和显著性检验复用。
+    """
+    records = {
+        contract_path: {
+            (metric_name, stat): metric_stats[stat]
+            for metric_name, metric_stats in metrics.items()
+            for stat in ('mean', 'std')
+        }
+        for contract_path, metrics in aggregated.items()
+    }
+    return pd.DataFrame.from_dict(records, orient='index', dtype=float)
+
+
+def compute_overall_statistics(tidy: pd.DataFrame, metric_name: str) -> dict:
     """
     Compute overall statistics across all contracts for a given metric.
     Uses the mean of each contract's mean values.
     """
-    means = []
-    stds = []
+    if (metric_name, 'mean') not in tidy:
+        return {'overall_mean': None, 'overall_std': None, 'avg_within_contract_std': None}
     
-    for contract_path, metrics in aggregated.items():
-        if metric_name in metrics and metrics[metric_name]['mean'] is not None:
-            means.append(metrics[metric_name]['mean'])
-            if metrics[metric_name]['std'] is not None:
-                stds.append(metrics[metric_name]['std'])
+    valid = tidy[tidy[(metric_name, 'mean')].notna()]
+    means = valid[(metric_name, 'mean')].to_numpy()
+    stds = valid[(metric_name, 'std')].dropna().to_numpy()
     
-    if not means:
+    if not len(means):
         return {'overall_mean': None, 'overall_std': None, 'avg_within_contract_std': None}
     
     return {
         'overall_mean': float(np.mean(means)),
         'overall_std': float(np.std(means, ddof=1)) if len(means) > 1 else 0.0,
-        'avg_within_contract_std': float(np.mean(stds)) if stds else None,
+        'avg_within_contract_std': float(np.mean(stds)) if len(stds) else None,
         'n_contracts': len(means)
     }
 
 
-def perform_significance_test(
-    aggregated_a: Dict[str, Dict[str, dict]], 
-    aggregated_b: Dict[str, Dict[str, dict]],
-    metric_name: str
-) -> Optional[dict]:
+def _mean_matrix(tidy: pd.DataFrame, columns: List[Tuple[str, str]], contracts: pd.Index) -> np.ndarray:
+    """按给定合约顺序取出各指标均值，返回 合约 × 指标 的矩阵（缺失为 NaN）"""
+    return np.column_stack([
+        tidy[column].reindex(contracts).to_numpy(dtype=float) if column in tidy
+        else np.full(len(contracts), np.nan)
+        for column in columns
+    ])
+
+
+def perform_significance_tests(
+    tidy_a: pd.DataFrame, 
+    tidy_b: pd.DataFrame,
+    metric_names: List[str]
+) -> Dict[str, dict]:
     """
-    Perform Wilcoxon signed-rank test comparing two modes.
+    Perform Wilcoxon signed-rank tests comparing two modes, one per metric.
     Uses the mean values from each contract.
     """
     if not SCIPY_AVAILABLE:
-        return None
-    
-    # Get common contracts
-    common_contracts = set(aggregated_a.keys()) & set(aggregated_b.keys())
-    
-    values_a = []
-    values_b = []
-    
-    for contract in common_contracts:
-        mean_a = aggregated_a[contract].get(metric_name, {}).get('mean')
-        mean_b = aggregated_b[contract].get(metric_name, {}).get('mean')
-        
-        if mean_a is not None and mean_b is not None:
-            values_a.append(mean_a)
-            values_b.append(mean_b)
-    
-    if len(values_a) < 5:
-        return {'error': f'Too few paired samples ({len(values_a)}) for statistical test'}
-    
-    try:
-        # Wilcoxon signed-rank test (paired, non-parametric)
-        statistic, p_value = stats.wilcoxon(values_a, values_b)
-        
-        # Also compute effect size (matched-pairs rank-biserial correlation)
-        diff = np.array(values_b) - np.array(values_a)
-        n = len(diff)
-        
-        # Cohen's d for paired samples
-        mean_diff = np.mean(diff)
-        std_diff = np.std(diff, ddof=1)
-        cohens_d = mean_diff / std_diff if std_diff > 0 else 0
+        return {}
+    
+    # Get common contracts once and build contracts × metrics matrices of means
+    columns = [(metric_name, 'mean') for metric_name in metric_names]
+    common_contracts = tidy_a.index.intersection(tidy_b.index)
+    means_a = _mean_matrix(tidy_a, columns, common_contracts)
+    means_b = _mean_matrix(tidy_b, columns, common_contracts)
+    
+    paired = ~(np.isnan(means_a) | np.isnan(means_b))
+    n_pairs = paired.sum(axis=0)
+    
+    # Cohen's d for paired samples, vectorized across metrics (unpaired cells contribute 0)
+    diff = np.where(paired, means_b - means_a, 0.0)
+    mean_diff = diff.sum(axis=0) / np.maximum(n_pairs, 1)
+    squared_dev = np.where(paired, (diff - mean_diff) ** 2, 0.0)
+    std_diff = np.sqrt(squared_dev.sum(axis=0) / np.maximum(n_pairs - 1, 1))
+    
+    results = {}
+    for i, metric_name in enumerate(metric_names):
+        mask = paired[:, i]
+        if n_pairs[i] < 5:
+            results[metric_name] = {'error': f'Too few paired samples ({n_pairs[i]}) for statistical test'}
+            continue
         
-        return {
-            'test': 'Wilcoxon signed-rank',
-            'statistic': float(statistic),
-            'p_value': float(p_value),
-            'n_pairs': len(values_a),
-            'significant_0.05': p_value < 0.05,
-            'significant_0.01': p_value < 0.01,
-            'cohens_d': float(cohens_d),
-            'mean_improvement': float(np.mean(values_b) - np.mean(values_a))
-        }
-    except Exception as e:
-        return {'error': str(e)}
+        try:
+            # Wilcoxon signed-rank test (paired, non-parametric)
+            statistic, p_value = stats.wilcoxon(means_a[mask, i], means_b[mask, i])
+            cohens_d = mean_diff[i] / std_diff[i] if std_diff[i] > 0 else 0
+            
+            results[metric_name] = {
+                'test': 'Wilcoxon signed-rank',
+                'statistic': float(statistic),
+                'p_value': float(p_value),
+                'n_pairs': int(n_pairs[i]),
+                'significant_0.05': p_value < 0.05,
+                'significant_0.01': p_value < 0.01,
+                'cohens_d': float(cohens_d),
+                'mean_improvement': float(mean_diff[i])
+            }
+        except Exception as e:
+            results[metric_name] = {'error': str(e)}
+    
+    return results
 
 
 def write_per_contract_csv(
@@ -200,47 +245,32 @@ def write_per_contract_csv(
     
     metrics = ['branch_coverage', 'code_coverage', 'execution_time']
     
-    # Build header
-    header = ['Contract Path']
+    # Get all contracts that have data for at least one reported metric in one of the modes
+    # (跳过所有单元格都会是 N/A 的合约)
+    all_contracts = sorted({
+        contract
+        for mode in modes
+        for contract, contract_metrics in aggregated_results.get(mode, {}).items()
+        if any(metric in contract_metrics for metric in metrics)
+    })
+    
+    # 按列构建数据，由 pandas 统一完成格式化和写入
+    data = {'Contract Path': all_contracts}
     for mode in modes:
+        mode_results = aggregated_results.get(mode, {})
         for metric in metrics:
-            header.extend([
-                f'{metric}_mean ({mode})',
-                f'{metric}_std ({mode})',
-                f'{metric}_min ({mode})',
-                f'{metric}_max ({mode})',
-                f'{metric}_n_runs ({mode})'
-            ])
-    
-    # Get all contracts
-    all_contracts = sorted(set().union(*[res.keys() for res in aggregated_results.values()]))
+            per_contract = [mode_results.get(contract, {}).get(metric, {}) for contract in all_contracts]
+            for stat in ('mean', 'std', 'min', 'max'):
+                data[f'{metric}_{stat} ({mode})'] = [s.get(stat) for s in per_contract]
+            data[f'{metric}_n_runs ({mode})'] = [s.get('n_runs', 0) for s in per_contract]
     
-    rows = []
-    for contract in all_contracts:
-        row = [contract]
-        for mode in modes:
-            mode_data = aggregated_results.get(mode, {}).get(contract, {})
-            for metric in metrics:
-                stats = mode_data.get(metric, {})
-                row.extend([
-                    f"{stats.get('mean', 'N/A'):.2f}" if stats.get('mean') is not None else 'N/A',
-                    f"{stats.get('std', 'N/A'):.2f}" if stats.get('std') is not None else 'N/A',
-                    f"{stats.get('min', 'N/A'):.2f}" if stats.get('min') is not None else 'N/A',
-                    f"{stats.get('max', 'N/A'):.2f}" if stats.get('max') is not None else 'N/A',
-                    stats.get('n_runs', 0)
-                ])
-        rows.append(row)
-    
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(rows)
+    pd.DataFrame(data).to_csv(output_path, index=False, float_format='%.2f', na_rep='N/A')
     
     print(f"\n📄 每合约统计数据已保存至: {output_path}")
 
 
 def write_summary_report(
-    aggregated_results: Dict[str, Dict[str, Dict[str, dict]]],
+    tidy_results: Dict[str, pd.DataFrame],
     modes: List[str],
     significance_results: Dict[str, dict],
     run_counts: Dict[str, int],
@@ -269,11 +299,11 @@ def write_summary_report(
         
         for metric in metrics:
             f.write(f"\n{metric.upper().replace('_', ' ')}:\n")
-            f.write(f"{模式':<15} {'平均值':>10} {'标准差':>10} {'合约内平均标准差':>25} {'N':>5}\n")
+            f.write(f"{'模式':<15} {'平均值':>10} {'标准差':>10} {'合约内平均标准差':>25} {'N':>5}\n")
             f.write("-" * 70 + "\n")
             
             for mode in modes:
-                overall = compute_overall_statistics(aggregated_results[mode], metric)
+                overall = compute_overall_statistics(tidy_results[mode], metric)
                 mean_str = f"{overall['overall_mean']:.2f}" if overall['overall_mean'] is not None else "N/A"
                 std_str = f"{overall['overall_std']:.2f}" if overall['overall_std'] is not None else "N/A"
                 within_std = f"{overall['avg_within_contract_std']:.2f}" if overall.get('avg_within_contract_std') is not None else "N/A"
@@ -343,6 +373,7 @@ def main():
     
     # Load all runs for each mode
     aggregated_results = {}
+    tidy_results = {}
     run_counts = {}
     
     for mode in args.modes:
@@ -357,6 +388,7 @@ def main():
         print(f"  Total runs loaded: {len(runs)}")
         
         aggregated_results[mode] = aggregate_runs(runs)
+        tidy_results[mode] = build_tidy_statistics(aggregated_results[mode])
     
     if not aggregated_results:
         print("\n[Error] No valid results to analyze.")
@@ -373,16 +405,11 @@ def main():
         for other_mode in args.modes[1:]:
             if baseline_mode in aggregated_results and other_mode in aggregated_results:
                 comparison_key = f"{baseline_mode} vs {other_mode}"
-                significance_results[comparison_key] = {}
-                
-                for metric in metrics:
-                    result = perform_significance_test(
-                        aggregated_results[baseline_mode],
-                        aggregated_results[other_mode],
-                        metric
-                    )
-                    if result:
-                        significance_results[comparison_key][metric] = result
+                significance_results[comparison_key] = perform_significance_tests(
+                    tidy_results[baseline_mode],
+                    tidy_results[other_mode],
+                    metrics
+                )
     
     # Create output directory
     output_dir = Path(args.output_dir)
@@ -400,7 +427,7 @@ def main():
     )
     
     write_summary_report(
-        aggregated_results,
+        tidy_results,
         args.modes,
         significance_results,
         run_counts,
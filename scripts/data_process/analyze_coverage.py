@@ -3,29 +3,56 @@
 import pandas as pd
 import os
 
+# 可选: pyarrow 用于加速 CSV 解析
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+COVERAGE_COLUMNS = ['Branch Coverage (baseline)', 'Branch Coverage (llm-mutate)',
+                    'Code Coverage (baseline)', 'Code Coverage (llm-mutate)']
+
+
+def _pct(s):
+    """将百分比字符串（如 '12.5%'）转换为浮点数，空值或 'N/A' 等非数值单元格记为 NaN"""
+    try:
+        return float(s.rstrip('%'))
+    except ValueError:
+        return float('nan')
+
+
+def load_comparison_csv(path):
+    """读取对比CSV，并将覆盖率百分比列转换为浮点数"""
+    if not PYARROW_AVAILABLE:
+        # 解析时直接将百分比字符串转换为浮点数
+        return pd.read_csv(path, converters={col: _pct for col in COVERAGE_COLUMNS})
+    
+    # 覆盖率列按字符串读入，转换为 pandas 后统一去掉百分号
+    table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(
+        column_types={col: pa.string() for col in COVERAGE_COLUMNS},
+        strings_can_be_null=True
+    ))
+    df = table.to_pandas()
+    for col in COVERAGE_COLUMNS:
+        # 与 _pct 一致: 无法解析的单元格（如 '-'）记为 NaN
+        df[col] = pd.to_numeric(df[col].str.rstrip('%'), errors='coerce')
+    return df
+
+
 def analyze_and_extract_improvements():
     # 读取CSV文件
-    df = pd.read_csv('comparison_reports/comparison_2094_new_solc_v0.4.26-evm_byzantium-gen_10_baseline_vs_llm-mutate.csv')
+    df = load_comparison_csv('comparison_reports/comparison_2094_new_solc_v0.4.26-evm_byzantium-gen_10_baseline_vs_llm-mutate.csv')
     
-    # 转换百分比字符串为浮点数
-    df['Branch Coverage (baseline)'] = df['Branch Coverage (baseline)'].str.rstrip('%').astype(float)
-    df['Branch Coverage (llm-mutate)'] = df['Branch Coverage (llm-mutate)'].str.rstrip('%').astype(float)
-    df['Code Coverage (baseline)'] = df['Code Coverage (baseline)'].str.rstrip('%').astype(float)
-    df['Code Coverage (llm-mutate)'] = df['Code Coverage (llm-mutate)'].str.rstrip('%').astype(float)
+    # 找出表现更好的案例并计算改进幅度（差值只计算一次，同时用于筛选）
+    branch_delta = df['Branch Coverage (llm-mutate)'] - df['Branch Coverage (baseline)']
+    code_delta = df['Code Coverage (llm-mutate)'] - df['Code Coverage (baseline)']
     
-    # 找出表现更好的案例并计算改进幅度
-    branch_improvements = df[df['Branch Coverage (llm-mutate)'] > df['Branch Coverage (baseline)']].copy()
-    code_improvements = df[df['Code Coverage (llm-mutate)'] > df['Code Coverage (baseline)']].copy()
-    
-    branch_improvements['Improvement'] = (
-        branch_improvements['Branch Coverage (llm-mutate)'] - 
-        branch_improvements['Branch Coverage (baseline)']
-    )
-    
-    code_improvements['Improvement'] = (
-        code_improvements['Code Coverage (llm-mutate)'] - 
-        code_improvements['Code Coverage (baseline)']
-    )
+    branch_mask = branch_delta > 0
+    code_mask = code_delta > 0
+    branch_improvements = df[branch_mask].assign(Improvement=branch_delta[branch_mask])
+    code_improvements = df[code_mask].assign(Improvement=code_delta[code_mask])
     
     # 按改进幅度排序
     branch_improvements = branch_improvements.sort_values('Improvement', ascending=False)
@@ -47,21 +74,24 @@ def analyze_and_extract_improvements():
         f.write(f"Number of contracts with improvements: {len(branch_improvements)}\n")
         f.write(f"Percentage of total: {(len(branch_improvements) / len(df)) * 100:.2f}%\n\n")
         f.write("All Branch Coverage Improvements:\n")
-        f.write(branch_improvements[['Contract Path', 
-                                   'Branch Coverage (baseline)',
-                                   'Branch Coverage (llm-mutate)',
-                                   'Improvement']].to_string())
-        f.write("\n\n")
+        # 直接以制表符分隔写入文件，避免先在内存中拼出整张表的字符串
+        branch_improvements[['Contract Path', 
+                             'Branch Coverage (baseline)',
+                             'Branch Coverage (llm-mutate)',
+                             'Improvement']].to_csv(
+            f, sep='\t', index=False, float_format='%.2f')
+        f.write("\n")
         
         # Code Coverage 详细信息
         f.write("Code Coverage Improvements:\n")
         f.write(f"Number of contracts with improvements: {len(code_improvements)}\n")
         f.write(f"Percentage of total: {(len(code_improvements) / len(df)) * 100:.2f}%\n\n")
         f.write("All Code Coverage Improvements:\n")
-        f.write(code_improvements[['Contract Path', 
-                                 'Code Coverage (baseline)',
-                                 'Code Coverage (llm-mutate)',
-                                 'Improvement']].to_string())
+        code_improvements[['Contract Path', 
+                           'Code Coverage (baseline)',
+                           'Code Coverage (llm-mutate)',
+                           'Improvement']].to_csv(
+            f, sep='\t', index=False, float_format='%.2f')
         
     # 将改进的合约信息保存为CSV
     branch_improvements.to_csv(f'{output_dir}/branch_improvements.csv', index=False)
@@ -74,30 +104,31 @@ def analyze_and_extract_improvements():
         code_improvements['Contract Path']
     ]).unique()
     
-    # 2. 创建合并数据框
-    merged_improvements = pd.DataFrame()
-    for contract in improved_contracts:
-        branch_data = branch_improvements[branch_improvements['Contract Path'] == contract]
-        code_data = code_improvements[code_improvements['Contract Path'] == contract]
-        
-        row_data = {
-            'Contract Path': contract,
-            'Branch Coverage (baseline)': branch_data['Branch Coverage (baseline)'].iloc[0] if not branch_data.empty else None,
-            'Branch Coverage (llm-mutate)': branch_data['Branch Coverage (llm-mutate)'].iloc[0] if not branch_data.empty else None,
-            'Branch Coverage Improvement': branch_data['Improvement'].iloc[0] if not branch_data.empty else None,
-            'Code Coverage (baseline)': code_data['Code Coverage (baseline)'].iloc[0] if not code_data.empty else None,
-            'Code Coverage (llm-mutate)': code_data['Code Coverage (llm-mutate)'].iloc[0] if not code_data.empty else None,
-            'Code Coverage Improvement': code_data['Improvement'].iloc[0] if not code_data.empty else None,
-            'Execution Time (baseline)': df[df['Contract Path'] == contract]['Execution Time (baseline)'].iloc[0],
-            'Execution Time (llm-mutate)': df[df['Contract Path'] == contract]['Execution Time (llm-mutate)'].iloc[0]
-        }
-        merged_improvements = pd.concat([merged_improvements, pd.DataFrame([row_data])], ignore_index=True)
+    # 2. 创建合并数据框（按合约路径做哈希连接，避免逐合约布尔筛选）
+    branch_part = branch_improvements[['Contract Path',
+                                       'Branch Coverage (baseline)',
+                                       'Branch Coverage (llm-mutate)',
+                                       'Improvement']].rename(
+        columns={'Improvement': 'Branch Coverage Improvement'})
+    code_part = code_improvements[['Contract Path',
+                                   'Code Coverage (baseline)',
+                                   'Code Coverage (llm-mutate)',
+                                   'Improvement']].rename(
+        columns={'Improvement': 'Code Coverage Improvement'})
+    time_part = df[['Contract Path',
+                    'Execution Time (baseline)',
+                    'Execution Time (llm-mutate)']]
     
-    # 按照分支覆盖率和代码覆盖率的改进幅度排序
-    merged_improvements['Sort Score'] = (
-        merged_improvements['Branch Coverage Improvement'].fillna(0) + 
-        merged_improvements['Code Coverage Improvement'].fillna(0)
+    merged_improvements = (
+        branch_part.drop_duplicates('Contract Path')
+        .merge(code_part.drop_duplicates('Contract Path'), on='Contract Path', how='outer')
+        .merge(time_part.drop_duplicates('Contract Path'), on='Contract Path', how='left')
     )
+    
+    # 按照分支覆盖率和代码覆盖率的改进幅度排序
+    merged_improvements['Sort Score'] = merged_improvements[
+        ['Branch Coverage Improvement', 'Code Coverage Improvement']
+    ].fillna(0).sum(axis=1)
     merged_improvements = merged_improvements.sort_values('Sort Score', ascending=False)
     
     # 删除排序用的列，并且不包含 Total Improvement
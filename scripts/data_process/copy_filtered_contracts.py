@@ -3,20 +3,24 @@
 import os
 import csv
 import argparse
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from copy_utils import COPY_WORKERS, scan_source_entries, probe_reflink, copy_entry
 
 def collect_contract_paths(csv_path):
-    """从CSV文件中收集合约路径"""
+    """从CSV文件中收集合约路径（只用到第一列，按行直接切分，不经过 csv 解析器）"""
     contracts = []
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if not row:
-                continue
+    with open(csv_path, 'r', encoding='utf-8', buffering=1 << 20) as f:
+        for line in f:
+            if line.startswith('"'):
+                # 带引号的字段仍交给 csv 模块处理
+                first = next(csv.reader([line]), [""])[0]
+            else:
+                first = line.split(",", 1)[0]
             # 跳过注释/表头
-            if row[0].startswith("//") or row[0].startswith("Contract Path"):
+            if first.startswith("//") or first.startswith("Contract Path"):
                 continue
-            contract_path = row[0].strip()
+            contract_path = first.strip()
             if contract_path and contract_path.endswith(".sol"):
                 contracts.append(contract_path)
     return contracts
@@ -24,17 +28,32 @@ def collect_contract_paths(csv_path):
 def copy_contracts(contract_paths, dst_dir):
     """复制合约文件到目标目录"""
     os.makedirs(dst_dir, exist_ok=True)
-    copied, missing = 0, 0
+    # 去重（保留首次出现的顺序），合并后的CSV中同一合约可能出现多次
+    unique_paths = list(dict.fromkeys(contract_paths))
+    if len(unique_paths) < len(contract_paths):
+        print(f"跳过重复条目: {len(contract_paths) - len(unique_paths)}")
+    contract_paths = unique_paths
+    entries = scan_source_entries(contract_paths)
+    # {目标路径: DirEntry}，保证每个目标文件只由一个复制任务写入
+    targets, missing = {}, 0
     for path in contract_paths:
-        if not os.path.exists(path):
+        entry = entries.get((os.path.dirname(path), os.path.basename(path)))
+        if entry is None:
             print(f"[缺失] {path}")
             missing += 1
             continue
-        filename = os.path.basename(path)
-        dst_path = os.path.join(dst_dir, filename)
-        shutil.copy2(path, dst_path)
-        copied += 1
-    return copied, missing
+        dst_path = os.path.join(dst_dir, entry.name)
+        if dst_path in targets:
+            # 不同目录下的同名合约会落到同一目标文件，与顺序复制一致保留最后一个
+            print(f"[同名覆盖] {targets[dst_path].path} -> {path}")
+        targets[dst_path] = entry
+    jobs = [(entry, dst_path) for dst_path, entry in targets.items()]
+    
+    if jobs:
+        use_reflink = probe_reflink(*jobs[0])
+        with ThreadPoolExecutor(max_workers=min(COPY_WORKERS, len(jobs))) as executor:
+            list(executor.map(lambda job: copy_entry(*job, use_reflink), jobs))
+    return len(jobs), missing
 
 def main():
     parser = argparse.ArgumentParser(description="将过滤后比较CSV中列出的合约复制到新文件夹")
@@ -0,0 +1,64 @@
+# 合约文件复制公共函数
+# 供 copy_filtered_contracts.py 与 extract_successful_contracts.py 共用
+import os
+import shutil
+import stat
+from collections import defaultdict
+
+# 可选: fcntl 用于 reflink（写时复制克隆），仅类 Unix 平台可用
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# 复制是 I/O 密集型操作，用多个线程让多个拷贝同时进行
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Linux FICLONE ioctl 编号（Btrfs/XFS 等支持写时复制的文件系统）
+FICLONE = 0x40049409
+
+def scan_source_entries(paths):
+    """按所在目录分组，每个目录只 scandir 一次，返回 {(目录, 文件名): DirEntry}"""
+    names_by_dir = defaultdict(set)
+    for path in paths:
+        names_by_dir[os.path.dirname(path)].add(os.path.basename(path))
+    
+    entries = {}
+    for dirname, names in names_by_dir.items():
+        try:
+            with os.scandir(dirname or ".") as it:
+                for entry in it:
+                    if entry.name in names and entry.is_file():
+                        entries[(dirname, entry.name)] = entry
+        except OSError:
+            continue
+    return entries
+
+def _reflink(src, dst):
+    """通过 FICLONE 克隆文件，只共享数据块而不实际拷贝；不支持时抛出 OSError"""
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def probe_reflink(entry, dst_path):
+    """用第一个文件探测目标文件系统是否支持 reflink，避免对每个文件重复失败的 ioctl"""
+    if not FCNTL_AVAILABLE:
+        return False
+    try:
+        _reflink(entry.path, dst_path)
+        return True
+    except OSError:
+        return False
+
+def copy_entry(entry, dst_path, use_reflink=False):
+    """复制文件内容（优先 reflink，否则 copyfile 走内核零拷贝路径），再用缓存的 stat 恢复时间戳和权限"""
+    if use_reflink:
+        try:
+            _reflink(entry.path, dst_path)
+        except OSError:
+            # 例如源文件位于其他文件系统 (EXDEV)
+            shutil.copyfile(entry.path, dst_path)
+    else:
+        shutil.copyfile(entry.path, dst_path)
+    st = entry.stat()
+    os.utime(dst_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.chmod(dst_path, stat.S_IMODE(st.st_mode))
@@ -2,9 +2,40 @@
 # 用于从实验结果中提取成功执行的合约文件
 import json
 import os
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from copy_utils import COPY_WORKERS, scan_source_entries, probe_reflink, copy_entry
+
+# 可选: ijson 用于流式读取 results.json，只取键而不在内存中构建整个结果字典
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+def load_result_keys(results_file):
+    """读取 results.json 顶层对象的键（合约路径）"""
+    if IJSON_AVAILABLE:
+        try:
+            with open(results_file, 'rb') as f:
+                return [key for key, _ in ijson.kvitems(f, '')]
+        except ijson.JSONError:
+            # json.dump 可能写出 NaN/Infinity，ijson 无法解析，退回标准库
+            pass
+    with open(results_file, 'r') as f:
+        return list(json.load(f).keys())
+
+
+def _copy_one(job, use_reflink=False):
+    """复制单个合约 (contract_path, rel_path, entry, new_path)，返回错误信息（成功时为 None）"""
+    _, _, entry, new_path = job
+    try:
+        copy_entry(entry, new_path, use_reflink)
+        return None
+    except Exception as e:
+        return str(e)
+
 
 # 记录：2094下执行结果为 944
 def extract_successful_contracts(results_file, output_dir=None):
@@ -22,44 +53,62 @@ def extract_successful_contracts(results_file, output_dir=None):
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
     
-    # 读取 results.json
-    with open(results_file, 'r') as f:
-        results = json.load(f)
+    # 读取 results.json（只需要合约路径），去重并保留首次出现的顺序
+    result_keys = load_result_keys(results_file)
+    contract_paths = list(dict.fromkeys(result_keys))
+    duplicates = len(result_keys) - len(contract_paths)
     
     # 统计信息
-    total_contracts = len(results)
+    total_contracts = len(contract_paths)
     copied_contracts = 0
     skipped_contracts = 0
     errors = []
     
     print(f"\n🔍 从 {results_file} 中提取成功合约")
     print(f"📁 输出目录: {output_dir}\n")
+    if duplicates:
+        print(f"🔁 Skipped {duplicates} duplicate entries\n")
+
+    # 每个源目录只扫描一次，后续直接使用缓存的目录项
+    entries = scan_source_entries(contract_paths)
 
-    # 处理每个合约
-    for contract_path in results.keys():
+    # 处理每个合约：先解析源文件和目标路径，再并行复制
+    jobs = []
+    for contract_path in contract_paths:
+        # 检查原始文件是否存在
+        entry = entries.get((os.path.dirname(contract_path), os.path.basename(contract_path)))
+        if entry is None:
+            print(f"❌ Source file not found: {contract_path}")
+            skipped_contracts += 1
+            continue
+        
+        # 获取相对路径结构
+        rel_path = os.path.relpath(contract_path, "dataset")
+        jobs.append((contract_path, rel_path, entry, os.path.join(output_dir, rel_path)))
+    
+    # 每个目标子目录只创建一次；失败时由对应的复制任务报告错误
+    for parent in {os.path.dirname(job[3]) for job in jobs}:
         try:
-            # 检查原始文件是否存在
-            if not os.path.exists(contract_path):
-                print(f"❌ Source file not found: {contract_path}")
-                skipped_contracts += 1
-                continue
-                
-            # 获取相对路径结构
-            rel_path = os.path.relpath(contract_path, "dataset")
-            new_path = os.path.join(output_dir, rel_path)
-            
-            # 创建必要的子目录
-            os.makedirs(os.path.dirname(new_path), exist_ok=True)
-            
-            # 复制文件
-            shutil.copy2(contract_path, new_path)
+            os.makedirs(parent, exist_ok=True)
+        except OSError:
+            pass
+    
+    if jobs:
+        use_reflink = probe_reflink(*jobs[0][2:])
+        with ThreadPoolExecutor(max_workers=min(COPY_WORKERS, len(jobs))) as executor:
+            outcomes = list(executor.map(lambda job: _copy_one(job, use_reflink), jobs))
+    else:
+        outcomes = []
+    
+    # 在主线程中按原顺序输出结果
+    for (contract_path, rel_path, _, _), error in zip(jobs, outcomes):
+        if error is None:
             copied_contracts += 1
             print(f"✅ Copied: {rel_path}")
-            
-        except Exception as e:
-            errors.append((contract_path, str(e)))
+        else:
+            errors.append((contract_path, error))
             skipped_contracts += 1
-            print(f"❌ Error processing {contract_path}: {e}")
+            print(f"❌ Error processing {contract_path}: {error}")
     
     # 保存统计信息
     stats = {
@@ -4,13 +4,39 @@ import pandas as pd
 import argparse
 import os
 
+# 可选: pyarrow 用于加速 CSV 解析
+try:
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 def load_csv(path):
     """加载CSV文件，兼容注释行"""
-    df = pd.read_csv(path)
-    # 兼容可能带有注释首行 // filepath:
-    if df.columns[0].startswith("// filepath"):
-        df = pd.read_csv(path, skiprows=1)
-    return df
+    # 兼容可能带有注释首行 // filepath:（只读首行判断，避免整个文件解析两次）
+    with open(path, 'r', encoding='utf-8') as f:
+        skip = 1 if f.readline().startswith("// filepath") else 0
+    if not PYARROW_AVAILABLE:
+        return pd.read_csv(path, skiprows=skip)
+    table = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(skip_rows=skip),
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True)
+    )
+    return table.to_pandas()
+
+def already_merged(base_df, full_df, key_col, value_cols):
+    """base 中是否已包含 full 的全部合约且对应 llm-full 列的值完全一致"""
+    if any(c not in base_df.columns for c in value_cols):
+        return False
+    base = base_df.set_index(key_col)
+    full = full_df.set_index(key_col)
+    if not full.index.isin(base.index).all():
+        return False
+    current = base.loc[full.index, value_cols]
+    if current.isna().any(axis=None):
+        return False
+    return current.equals(full[value_cols])
 
 def main():
     parser = argparse.ArgumentParser(description="将llm-full CSV合并到多模式比较CSV中。")
@@ -20,6 +46,8 @@ def main():
                         help="包含llm-full列的CSV。")
     parser.add_argument("--output", required=False,
                         help="输出CSV路径。默认: <base>_merged_llm-full.csv")
+    parser.add_argument("--force", action="store_true",
+                        help="即使base CSV已包含相同的llm-full数据也重新合并并写出。")
     args = parser.parse_args()
 
     base_df = load_csv(args.base_csv)
@@ -47,9 +75,6 @@ def main():
     base_df = base_df.drop_duplicates(subset=[key_col], keep="first")
     full_df = full_df.drop_duplicates(subset=[key_col], keep="first")
 
-    # 合并（外连接：保留所有合约；若只想交集改 how='inner'）
-    merged = pd.merge(base_df, full_df, on=key_col, how="left")
-
     # 输出路径
     if args.output:
         out_path = args.output
@@ -57,6 +82,27 @@ def main():
         root, ext = os.path.splitext(args.base_csv)
         out_path = root + "_merged_llm-full" + ext
 
+    # 快速路径: base 已包含相同的 llm-full 数据时无需重新合并；输出文件（或输出即 base 本身）已存在时也无需重写
+    if not args.force and already_merged(base_df, full_df, key_col, expected_full_cols[1:]):
+        if os.path.exists(out_path):
+            print(f"{args.base_csv} 已包含相同的llm-full数据且 {out_path} 已存在，跳过合并（使用 --force 强制写出）。")
+            return
+        merged = base_df
+    else:
+        # 重新合并时先移除 base 中旧的 llm-full 列，避免产生 _x/_y 后缀列
+        base_df = base_df.drop(columns=[c for c in expected_full_cols[1:] if c in base_df.columns])
+
+        # 两侧键列转为共享类别的 Categorical，合并时按整数编码而非字符串哈希
+        categories = pd.api.types.union_categoricals([
+            base_df[key_col].astype("category"),
+            full_df[key_col].astype("category")
+        ]).categories
+        base_df[key_col] = pd.Categorical(base_df[key_col], categories=categories)
+        full_df[key_col] = pd.Categorical(full_df[key_col], categories=categories)
+
+        # 合并（外连接：保留所有合约；若只想交集改 how='inner'）
+        merged = pd.merge(base_df, full_df, on=key_col, how="left", validate="one_to_one")
+
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     merged.to_csv(out_path, index=False, encoding="utf-8")
 
@@ -1,38 +1,68 @@
 # LLM使用情况汇总脚本
 # 用于统计LLM调用的token消耗情况
 import json, os, argparse
-from collections import defaultdict
+
+# 可选: orjson 用于加速逐行解析
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# 计数器字段顺序，对应 [prompt, completion, total, calls]
+FIELDS = ("prompt", "completion", "total", "calls")
+# 每个合约固定输出的阶段
+DEFAULT_PHASES = ("total", "init", "mutation")
+# 每次读取的块大小
+CHUNK_SIZE = 4 * 1024 * 1024
+
+def iter_lines(f, chunk_size=CHUNK_SIZE):
+    """按大块读取二进制文件并切分为行，跨块的不完整行留到下一块拼接"""
+    tail = b""
+    while True:
+        buf = f.read(chunk_size)
+        if not buf:
+            break
+        lines = (tail + buf).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
 
 def main(log_path, out_path):
-    stats = defaultdict(lambda: {
-        "total": {"prompt":0,"completion":0,"total":0,"calls":0},
-        "init": {"prompt":0,"completion":0,"total":0,"calls":0},
-        "mutation": {"prompt":0,"completion":0,"total":0,"calls":0},
-    })
+    # {(合约, 阶段): [prompt, completion, total, calls]}，阶段 "total" 为合约总计
+    counters = {}
     if not os.path.exists(log_path):
         print(f"文件未找到: {log_path}")
         return
-    with open(log_path, "r", encoding="utf-8") as f:
-        for line in f:
+    with open(log_path, "rb") as f:
+        for line in iter_lines(f):
             if not line.strip(): continue
-            rec = json.loads(line)
+            rec = _loads(line)
             c = rec.get("contract","unknown")
             phase = rec.get("phase","init")
             p = int(rec.get("prompt_tokens",0))
             m = int(rec.get("completion_tokens",0))
             t = int(rec.get("total_tokens", p+m))
-            # 总计
-            stats[c]["total"]["prompt"] += p
-            stats[c]["total"]["completion"] += m
-            stats[c]["total"]["total"] += t
-            stats[c]["total"]["calls"] += 1
-            # 分阶段
-            if phase not in stats[c]:
-                stats[c][phase] = {"prompt":0,"completion":0,"total":0,"calls":0}
-            stats[c][phase]["prompt"] += p
-            stats[c][phase]["completion"] += m
-            stats[c][phase]["total"] += t
-            stats[c][phase]["calls"] += 1
+            # 总计 + 分阶段
+            for key in ((c, "total"), (c, phase)):
+                v = counters.get(key)
+                if v is None:
+                    v = counters[key] = [0, 0, 0, 0]
+                v[0] += p
+                v[1] += m
+                v[2] += t
+                v[3] += 1
+
+    # 最后一次性构建嵌套的统计字典
+    stats = {}
+    for (c, phase), v in counters.items():
+        entry = stats.get(c)
+        if entry is None:
+            entry = stats[c] = {ph: dict.fromkeys(FIELDS, 0) for ph in DEFAULT_PHASES}
+        entry[phase] = dict(zip(FIELDS, v))
 
     # 计算总体均值/中位数等（简版）
     per_contract_totals = [v["total"]["total"] for v in stats.values()]
@@ -44,8 +74,12 @@ def main(log_path, out_path):
         }
     }
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(summary, f, indent=2, ensure_ascii=False)
+    if ORJSON_AVAILABLE:
+        with open(out_path, "wb") as f:
+            f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+    else:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
     print(f"已写入: {out_path}")
 
 if __name__ == "__main__":
@@ -53,4 +87,4 @@ if __name__ == "__main__":
     parser.add_argument("--log", default="ConFuzzius/experiments_results/llm_usage.jsonl")
     parser.add_argument("--out", default="ConFuzzius/experiments_results/llm_usage_summary.json")
     args = parser.parse_args()
-    main(args.log, args.out)
\ No newline at end of file
+    main(args.log, args.out)
@@ -1,3 +1,5 @@
+import atexit
+import functools
 import json
 import os
 from datetime import datetime
@@ -10,12 +12,69 @@ import time
 from string import Template
 from collections import defaultdict  # 新增
 
+# 可选: orjson 用于加速日志序列化。
+# LLM 响应仍用标准库 json 解析: orjson 会把超过 64 位的整数转成 float，破坏 uint256 边界值
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _dumps(obj):
+    """序列化为单行 JSON 字符串（保留非 ASCII 字符）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+@functools.lru_cache(maxsize=None)
+def _open_jsonl_log(path):
+    """以追加模式打开 JSONL 日志（行缓冲，每条记录写完即刷新）；同一路径在进程内只打开一次，由所有 LLMGenerator 共用，退出时关闭"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fp = open(path, "a", encoding="utf-8", buffering=1)
+    atexit.register(fp.close)
+    return fp
+
 load_dotenv(find_dotenv())
 API_KEY = os.getenv("API_KEY")
 BASE_URL = os.getenv("BASE_URL")
 
 client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
 
+@functools.lru_cache(maxsize=32)
+def _load_prompt_template_cached(prompt_dir, prompt_name):
+    """读取prompt文件；模板是静态的，按 (目录, 文件名) 缓存，避免每次 LLM 调用都读盘"""
+    prompt_path = os.path.join(prompt_dir, prompt_name)
+    if not os.path.exists(prompt_path):
+        raise FileNotFoundError(
+            f"Prompt template '{prompt_name}' not found at {prompt_path}. "
+            f"Available templates: {os.listdir(prompt_dir)}"
+        )
+    with open(prompt_path, 'r') as f:
+        return f.read()
+
+def _to_int(value):
+    """整数类型参数: 十六进制/十进制字符串或数值转换为 int，其他保持不变"""
+    if isinstance(value, str):
+        return int(value, 16) if value.startswith('0x') else int(value)
+    if isinstance(value, (int, float)):
+        return int(value)
+    return value
+
+def _to_bool(value):
+    """布尔类型参数: 字符串 'true'/'false' 转换为 bool，其他保持不变"""
+    return value.lower() == 'true' if isinstance(value, str) else value
+
+def _keep(value):
+    return value
+
+def _coercer_for(expected_type):
+    """根据 Solidity 类型字符串选择参数转换函数"""
+    if 'uint' in expected_type or 'int' in expected_type:
+        return _to_int
+    if 'bool' in expected_type:
+        return _to_bool
+    return _keep
+
 class LLMGenerator:
     def __init__(self, generator):
         self.generator = generator
@@ -32,6 +91,7 @@ class LLMGenerator:
         self._usage_log = os.path.normpath(
             os.path.join(os.path.dirname(__file__), "../../../experiments_results/llm_usage.jsonl")
         )
+        self._usage_fp = None  # 首次写入时打开，之后复用
         
         # === 过滤统计器 (Filter Statistics) ===
         self.filter_stats = {
@@ -49,12 +109,15 @@ class LLMGenerator:
         self._filter_log = os.path.normpath(
             os.path.join(os.path.dirname(__file__), "../../../experiments_results/filter_stats.jsonl")
         )
+        self._filter_fp = None  # 首次写入时打开，之后复用
 
         # === 构建函数名到哈希的映射 (Function Name to Hash Mapping) ===
         # interface 的结构是 {hash: [input_types], "constructor": [...], "fallback": []}
         # 我们需要从 ABI 中提取函数名和参数类型，构建反向映射
         self.function_name_to_hash = {}  # {"transfer": "0x12345678", ...}
+        self.function_hash_to_name = {}  # {"0x12345678": "transfer", ...}
         self.function_info = {}  # {"transfer": {"hash": "0x...", "inputs": [...]}, ...}
+        self.coercers_by_hash = {}  # {"0x12345678": [_to_int, _keep, ...], ...}
         self._build_function_mappings()
 
         # 从合约路径中提取相对路径信息
@@ -119,19 +182,19 @@ class LLMGenerator:
                 self.usage_by_phase[phase]["completion"] += c
                 self.usage_by_phase[phase]["total"] += t
                 # 逐条写 JSONL，便于后处理
-                os.makedirs(os.path.dirname(self._usage_log), exist_ok=True)
-                with open(self._usage_log, "a", encoding="utf-8") as f:
-                    f.write(json.dumps({
-                        "ts": datetime.utcnow().isoformat() + "Z",
-                        "contract": self.generator.contract,
-                        "phase": phase,
-                        "mode": mode,
-                        "model": "deepseek-chat",
-                        "temperature": temperature,
-                        "prompt_tokens": p,
-                        "completion_tokens": c,
-                        "total_tokens": t
-                    }, ensure_ascii=False) + "\n")
+                if self._usage_fp is None:
+                    self._usage_fp = _open_jsonl_log(self._usage_log)
+                self._usage_fp.write(_dumps({
+                    "ts": datetime.utcnow().isoformat() + "Z",
+                    "contract": self.generator.contract,
+                    "phase": phase,
+                    "mode": mode,
+                    "model": "deepseek-chat",
+                    "temperature": temperature,
+                    "prompt_tokens": p,
+                    "completion_tokens": c,
+                    "total_tokens": t
+                }) + "\n")
 
             content = response.choices[0].message.content
             res = self._parse_and_validate_response(content)
@@ -180,9 +243,9 @@ class LLMGenerator:
         }
         
         try:
-            os.makedirs(os.path.dirname(self._filter_log), exist_ok=True)
-            with open(self._filter_log, "a", encoding="utf-8") as f:
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self._filter_fp is None:
+                self._filter_fp = _open_jsonl_log(self._filter_log)
+            self._filter_fp.write(_dumps(record) + "\n")
             self.logger.info(f"Filter stats exported: {total_rej}/{total_gen} rejected ({filter_rate:.1f}%)")
         except Exception as e:
             self.logger.error(f"Failed to export filter stats: {e}")
@@ -204,7 +267,15 @@ class LLMGenerator:
 
     def _build_function_mappings(self):
         """从 ABI 构建函数名到哈希值的映射"""
-        from web3 import Web3
+        from eth_utils import keccak
+        
+        # 按 interface 中的参数类型预先选好每个参数的转换函数，并缓存类型列表与参数个数
+        self._expected_types_by_hash = {h: tuple(v) for h, v in self.interface.items()}
+        self._expected_arg_count = {h: len(v) for h, v in self._expected_types_by_hash.items()}
+        self.coercers_by_hash = {
+            func_hash: [_coercer_for(t) for t in input_types]
+            for func_hash, input_types in self._expected_types_by_hash.items()
+        }
         
         if not self.abi:
             return
@@ -212,23 +283,16 @@ class LLMGenerator:
         for field in self.abi:
             if field.get('type') == 'function':
                 func_name = field['name']
-                inputs = field.get('inputs', [])
+                input_types = [inp['type'] for inp in field.get('inputs', [])]
                 
                 # 构建函数签名
-                signature = func_name + '('
-                input_types = []
-                for i, inp in enumerate(inputs):
-                    input_type = inp['type']
-                    input_types.append(input_type)
-                    signature += input_type
-                    if i < len(inputs) - 1:
-                        signature += ','
-                signature += ')'
+                signature = f"{func_name}({','.join(input_types)})"
                 
-                # 计算函数选择器 (4字节哈希) - 使用 sha3 代替 keccak
-                func_hash = Web3.sha3(text=signature)[0:4].hex()
+                # 计算函数选择器 (4字节哈希)
+                func_hash = '0x' + keccak(text=signature)[:4].hex()
                 
                 self.function_name_to_hash[func_name] = func_hash
+                self.function_hash_to_name[func_hash] = func_name
                 self.function_info[func_name] = {
                     "hash": func_hash,
                     "signature": signature,
@@ -238,8 +302,10 @@ class LLMGenerator:
         # 添加特殊函数
         if 'constructor' in self.interface:
             self.function_name_to_hash['constructor'] = 'constructor'
+            self.function_hash_to_name['constructor'] = 'constructor'
         if 'fallback' in self.interface:
             self.function_name_to_hash['fallback'] = 'fallback'
+            self.function_hash_to_name['fallback'] = 'fallback'
         
         self.logger.debug(f"Built function mappings: {list(self.function_name_to_hash.keys())}")
 
@@ -288,15 +354,10 @@ class LLMGenerator:
     读取prompt文件
     """
     def _load_prompt_template(self, prompt_name):
-        prompt_path = os.path.join(self.prompt_dir, prompt_name)
-        if not os.path.exists(prompt_path):
-            raise FileNotFoundError(
-                f"Prompt template '{prompt_name}' not found at {prompt_path}. "
-                f"Available templates: {os.listdir(self.prompt_dir)}"
-            )
         try:
-            with open(prompt_path, 'r') as f:
-                return f.read()
+            return _load_prompt_template_cached(self.prompt_dir, prompt_name)
+        except FileNotFoundError:
+            raise
         except Exception as e:
             self.logger.error(f"Failed to read prompt template '{prompt_name}': {str(e)}")
             raise
@@ -306,7 +367,7 @@ class LLMGenerator:
     """        
     def _parse_and_validate_response(self, text):    
         try:
-            data = json.loads(text.strip())
+            data = json.loads(text)
             cases = data.get("transactions", [])
             
             # 记录本次 LLM 生成的总数
@@ -334,7 +395,7 @@ class LLMGenerator:
                     # LLM 返回的已经是哈希值或特殊标识符
                     function_hash = function_identifier
                     # 尝试找回函数名（用于日志）
-                    function_name = next((name for name, h in self.function_name_to_hash.items() if h == function_identifier), function_identifier)
+                    function_name = self.function_hash_to_name.get(function_identifier, function_identifier)
                 else:
                     self.logger.warning(f"Invalid function identifier in LLM response: {function_identifier}. Available functions: {list(self.function_name_to_hash.keys())}")
                     self.filter_stats["rejection_reasons"]["abi_mismatch"] += 1
@@ -390,39 +451,24 @@ class LLMGenerator:
         arguments = case["arguments"]
         function_hash = arguments[0]  # 此时已经是哈希值
 
-        # 步骤 A: 从 interface 中获取参数类型列表
+        # 步骤 A: 从缓存中获取参数类型列表
         # interface 的结构是 {hash: [input_types], "constructor": [...], "fallback": []}
-        if function_hash not in self.interface:
+        expected_types = self._expected_types_by_hash.get(function_hash)
+        if expected_types is None:
             raise ValueError(f"Function hash '{function_hash}' not found in fuzzer's interface.")
-
-        # 获取预期的参数类型列表
-        expected_types = self.interface[function_hash]
+        expected_count = self._expected_arg_count[function_hash]
         
         # 找回函数名用于日志（但保持 arguments[0] 为哈希值以兼容 Confuzzius 内部格式）
-        function_name = next((name for name, h in self.function_name_to_hash.items() if h == function_hash), function_hash)
+        function_name = self.function_hash_to_name.get(function_hash, function_hash)
         # 注意：不修改 arguments[0]，保持为哈希值！
         
         # 步骤 B: 使用获取到的类型信息进行清洗
-        llm_args = arguments[1:]
-        if len(expected_types) != len(llm_args):
-            raise ValueError(f"Argument count mismatch for '{function_name}'. Expected {len(expected_types)}, got {len(llm_args)}.")
-
-        for i, expected_type in enumerate(expected_types):
-            param_index_in_list = i + 1
-            actual_value = arguments[param_index_in_list]
-
-            if 'uint' in expected_type or 'int' in expected_type:
-                if isinstance(actual_value, str):
-                    if actual_value.startswith('0x'):
-                        arguments[param_index_in_list] = int(actual_value, 16)
-                    else:
-                        arguments[param_index_in_list] = int(actual_value)
-                elif isinstance(actual_value, (int, float)):
-                    arguments[param_index_in_list] = int(actual_value)
-            
-            elif 'bool' in expected_type:
-                 if isinstance(actual_value, str):
-                     arguments[param_index_in_list] = actual_value.lower() == 'true'
+        num_args = len(arguments) - 1
+        if expected_count != num_args:
+            raise ValueError(f"Argument count mismatch for '{function_name}'. Expected {expected_count}, got {num_args}.")
+
+        for i, coerce in enumerate(self.coercers_by_hash[function_hash], 1):
+            arguments[i] = coerce(arguments[i])
 
 
     # def save_cases_to_file(self, cases, output_dir="llm_cases"):    
@@ -1,77 +1,245 @@
+import ast
+import asyncio
+import hashlib
 import json
 import os
-from openai import OpenAI
-from Levenshtein import distance as levenshtein_distance
+import re
+import threading
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from typing import Dict, Tuple, Any
 
+# 编辑距离内核: 优先使用 editdistance（C++ 位并行实现），否则退回 python-Levenshtein
+try:
+    import editdistance
+    EDITDISTANCE_AVAILABLE = True
+    levenshtein_distance = editdistance.eval
+except ImportError:
+    EDITDISTANCE_AVAILABLE = False
+    from Levenshtein import distance as levenshtein_distance
+
+# 可选: orjson 用于加速 LLM 响应解析；orjson.JSONDecodeError 是 json.JSONDecodeError 的子类。
+# 变异策略只包含函数名和参数名字符串，不涉及 orjson 对超过 64 位整数的精度问题
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# 可选: ijson 用于在流式响应到达过程中增量解析已完成的函数条目
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# 可选: diskcache 作为变异策略缓存的存储后端；未安装时每个键存为一个 JSON 文件
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+# 可选: rapidfuzz 用于带阈值提前退出的批量模糊匹配
+try:
+    from rapidfuzz import process as rf_process
+    from rapidfuzz.distance import Levenshtein as rf_levenshtein
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
 BASE_URL = os.getenv("BASE_URL")
+# 设置后按 合约 + 函数执行序列 持久化 LLM 返回的变异策略，重复实验命中时跳过网络请求
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR")
+
+# LLM 响应首尾的 markdown 代码块标记（```json / ```）
+_JSON_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+# 所有 LLMMutator 共用一个后台事件循环线程，LLM 请求在其中异步执行
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    """获取（必要时启动）后台事件循环"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-mutator-loop", daemon=True).start()
+        return _loop
+
+class _StrategyCache:
+    """磁盘上的变异策略缓存: 优先使用 diskcache，否则每个键一个 JSON 文件"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._cache = diskcache.Cache(directory) if DISKCACHE_AVAILABLE else None
+
+    def get(self, key):
+        if self._cache is not None:
+            return self._cache.get(key)
+        try:
+            with open(os.path.join(self.directory, key + ".json"), "rb") as f:
+                return _loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        if self._cache is not None:
+            self._cache.set(key, value)
+            return
+        # 先写临时文件再替换，避免并发实验读到写了一半的文件
+        path = os.path.join(self.directory, key + ".json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if ORJSON_AVAILABLE:
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(value))
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+class _CompletionStreamReader:
+    """把流式响应包装成 ijson 可读取的异步文件对象，同时保留完整文本"""
+    def __init__(self, stream):
+        self._chunks = stream.__aiter__()
+        self.parts = []
+
+    async def read(self, size=-1):
+        # ijson 会先调用 read(0) 探测返回类型，此时不能消费数据
+        if size == 0:
+            return b""
+        while True:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return b""
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = chunk.choices[0].delta.content
+                self.parts.append(text)
+                return text.encode("utf-8")
+
+    async def drain(self):
+        while await self.read():
+            pass
+
+    @property
+    def text(self):
+        return "".join(self.parts)
 
 class LLMMutator:
-    def __init__(self, abi, contract_source=""):
+    def __init__(self, abi, contract_source="", cache_dir=LLM_CACHE_DIR):
         self.abi = abi
         self.contract_source = contract_source
-        self.state_functions = self._extract_state_functions()
+        # {函数名: [参数名, ...]} 用于校验；格式化字符串只构建一次，用于 prompt
+        self.state_functions, self.state_functions_prompt = self._extract_state_functions()
+        self._state_param_sets = {name: frozenset(params) for name, params in self.state_functions.items()}
+        # prompt 中的静态部分（合约源码、状态函数、输出格式说明），每个合约只格式化一次
+        self._prompt_body = f"""{contract_source}
+
+            Please use the exact parameter names from the following state functions to provide mutation suggestions.
+            State functions and their parameters are as follows: {self.state_functions_prompt}.
+    
+            Based on the analysis of the execution trace and contract logic, please identify the function parameters that are the **most promising targets for mutation** to discover new behaviors or vulnerabilities.
+
+            Your result should be a JSON object where the key is the function name and the value is a list of parameter names that should be prioritized for mutation.
+
+            Example format:
+            {{
+                "transfer": ["amount"],
+                "approve": ["spender", "amount"],
+                "withdraw": [] 
+            }}
+
+            Only list the parameters that you have a high confidence will be impactful. If no parameters in a function are promising, provide an empty list.
+            """
         self.remind_history = ""
         self.max_edit_distance = 2
+        self.max_validation_errors = 3 # 收集到这么多条错误后停止校验，直接进入下一次重试
+        # 当前请求中已完整到达的 {函数名: [参数名, ...]}，请求完成前可供变异提前使用
+        self.partial_strategy = {}
 
-        self.client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+        self.client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL)
+        self._cache = _StrategyCache(cache_dir) if cache_dir else None
+        # 缓存键 = 合约（源码 + 状态函数）+ 执行序列；随机的测试用例参数值和原始日志不参与，否则几乎不会命中
+        self._cache_key_prefix = hashlib.blake2b(
+            f"{contract_source}\0{self.state_functions_prompt}\0".encode("utf-8"), digest_size=16
+        )
     
-    # prompt里用到
     def _extract_state_functions(self):
-        """提取状态变更函数的信息，格式化为 'index:function_signature' 形式
+        """提取状态变更函数的信息（单次遍历 ABI）
         Returns:
-            str: 格式化后的函数签名字符串, 如 "1:deposit(uint256 amount),2:withdraw(uint256 value)"
+            Tuple[Dict[str, list], str]: 函数名到参数名列表的映射，以及 prompt 里用到的
+            'index:function_signature' 格式字符串, 如 "1:deposit(uint256 amount),2:withdraw(uint256 value)"
         """
-        functions = []
-        index = 1
+        state_functions = {}
+        signatures = []
+        constructor = None
 
-        # 处理普通函数
         for func in self.abi:
+            # 处理普通函数
             if func['type'] == 'function' and not func['constant']:
-                # 构建参数列表，格式为 "type name"
-                params = []
-                for inp in func['inputs']:
-                    param_str = f"{inp['type']} {inp['name']}"
-                    params.append(param_str)
-                
-                # 构建完整的函数签名
-                signature = f"{index}:{func['name']}({','.join(params)})"
-                functions.append(signature)
-                index += 1
-        
-        # 处理构造函数
-        for func in self.abi:
-            if func['type'] == 'constructor':
-                params = []
-                for inp in func['inputs']:
-                    param_str = f"{inp['type']} {inp['name']}"
-                    params.append(param_str)
-                
-                signature = f"{index}:constructor({','.join(params)})"
-                functions.append(signature)
-                break  # 只处理一个构造函数
+                name = func['name']
+            # 处理构造函数（只处理第一个）
+            elif func['type'] == 'constructor' and constructor is None:
+                constructor = func
+                continue
+            else:
+                continue
+            self._add_state_function(state_functions, signatures, name, func['inputs'])
+
+        if constructor is not None:
+            self._add_state_function(state_functions, signatures, 'constructor', constructor['inputs'])
+
+        return state_functions, ",".join(signatures)
 
-        return ",".join(functions)
+    @staticmethod
+    def _add_state_function(state_functions, signatures, name, inputs):
+        # 构建参数列表，格式为 "type name"，以及完整的函数签名
+        params = ",".join(f"{inp['type']} {inp['name']}" for inp in inputs)
+        signatures.append(f"{len(signatures) + 1}:{name}({params})")
+        # 重载函数的参数名合并到同一个函数名下
+        param_names = state_functions.setdefault(name, [])
+        for inp in inputs:
+            if inp['name'] not in param_names:
+                param_names.append(inp['name'])
 
     def _clean_json_string(self, response_str: str) -> str:
-        """清理 LLM 响应中的 JSON 字符串"""
-        if response_str.startswith("```json"):
-            response_str = response_str[7:]
-        if response_str.endswith("```"):
-            response_str = response_str[:-3]
-        
-        response_str = response_str.strip()
-        # 替换可能存在的单引号
-        response_str = response_str.replace("'", '"')
-        return response_str
+        """清理 LLM 响应中的 JSON 字符串: 去掉代码块标记，单引号字典按 Python 字面量解析后转成 JSON"""
+        response_str = _JSON_FENCE_RE.sub("", response_str)
+        try:
+            _loads(response_str)
+            return response_str
+        except ValueError:
+            pass
+        # 整体替换单引号会破坏含撇号的字符串，优先按 Python 字面量解析后转换
+        try:
+            return json.dumps(ast.literal_eval(response_str), ensure_ascii=False)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            # 单引号与 JSON 字面量混用（如 {'a': true}）时无法按 Python 解析，退回替换单引号
+            return response_str.replace("'", '"')
 
     def _calculate_edit_distance(self, s1, s2):
         """计算两个字符串之间的莱文斯坦编辑距离"""
         return levenshtein_distance(s1, s2)
 
+    def _find_closest(self, query, choices):
+        """在 choices 中查找与 query 编辑距离最小且不超过 max_edit_distance 的候选，找不到时返回 None"""
+        if RAPIDFUZZ_AVAILABLE:
+            match = rf_process.extractOne(query, choices, scorer=rf_levenshtein.distance,
+                                          processor=None, score_cutoff=self.max_edit_distance)
+            return match[0] if match else None
+        best, best_distance = None, self.max_edit_distance + 1
+        for choice in choices:
+            distance = self._calculate_edit_distance(query, choice)
+            if distance < best_distance:
+                best, best_distance = choice, distance
+        return best
+
     def _validate_and_parse_feedback(self, feedback_str):
         """
         一个为新Prompt设计的验证函数。
@@ -87,7 +255,7 @@ class LLMMutator:
                 return False, None, "The feedback did not contain a valid JSON object. "
             
             json_str = feedback_str[start_pos:end_pos]
-            llm_feedback = json.loads(json_str)
+            llm_feedback = _loads(json_str)
         except json.JSONDecodeError:
             return False, None, "The feedback was not in a valid JSON format. "
 
@@ -95,20 +263,25 @@ class LLMMutator:
             return False, None, "The JSON object is empty or invalid. Please provide suggestions for all functions. "
 
         validated_strategy = {}
+        llm_func_names = list(llm_feedback.keys())
+        errors_found = 0
         
         # 2. 遍历合约中定义的所有函数 (ground truth)
         for func_name_from_contract, params_from_contract in self.state_functions.items():
+            # 错误已足够让 LLM 修正，不再继续遍历 ABI
+            if errors_found >= self.max_validation_errors:
+                break
             
-            # 容错匹配：在LLM的反馈中查找函数名
-            matched_func_name_from_llm = None
-            for func_name_from_llm in llm_feedback.keys():
-                if self._calculate_edit_distance(func_name_from_contract, func_name_from_llm) <= self.max_edit_distance:
-                    matched_func_name_from_llm = func_name_from_llm
-                    break
+            # 容错匹配：在LLM的反馈中查找函数名（通常名字完全一致，先做字典查找）
+            if func_name_from_contract in llm_feedback:
+                matched_func_name_from_llm = func_name_from_contract
+            else:
+                matched_func_name_from_llm = self._find_closest(func_name_from_contract, llm_func_names)
             
             # 检查点 A: 确保每个函数都在LLM的反馈中
             if not matched_func_name_from_llm:
                 remind_message += f"The function '{func_name_from_contract}' is missing from your JSON response. "
+                errors_found += 1
                 continue
 
             llm_param_list = llm_feedback[matched_func_name_from_llm]
@@ -116,18 +289,19 @@ class LLMMutator:
             # 检查点 B: 确保值是一个列表
             if not isinstance(llm_param_list, list):
                 remind_message += f"For function '{func_name_from_contract}', the value must be a list of parameter names, but I received a {type(llm_param_list)}. "
+                errors_found += 1
                 continue
 
             validated_param_list = []
+            param_set_from_contract = self._state_param_sets[func_name_from_contract]
             # 3. 遍历LLM建议的参数列表
             for param_name_from_llm in llm_param_list:
                 
-                # 容错匹配：在合约的真实参数列表中查找LLM建议的参数
-                matched_param_name_from_contract = None
-                for p_name_from_contract in params_from_contract:
-                    if self._calculate_edit_distance(param_name_from_llm, p_name_from_contract) <= self.max_edit_distance:
-                        matched_param_name_from_contract = p_name_from_contract
-                        break
+                # 容错匹配：在合约的真实参数列表中查找LLM建议的参数（完全一致时跳过编辑距离计算）
+                if param_name_from_llm in param_set_from_contract:
+                    matched_param_name_from_contract = param_name_from_llm
+                else:
+                    matched_param_name_from_contract = self._find_closest(param_name_from_llm, params_from_contract)
 
                 # 检查点 C: 确保LLM建议的每个参数都真实存在
                 if matched_param_name_from_contract:
@@ -135,6 +309,9 @@ class LLMMutator:
                     validated_param_list.append(matched_param_name_from_contract)
                 else:
                     remind_message += f"In function '{func_name_from_contract}', you suggested mutating a parameter named '{param_name_from_llm}', but this parameter does not exist. The available parameters are: {params_from_contract}. "
+                    errors_found += 1
+                    if errors_found >= self.max_validation_errors:
+                        break
 
             # 存储经过验证和清理的策略
             validated_strategy[func_name_from_contract] = validated_param_list
@@ -151,45 +328,82 @@ class LLMMutator:
         return True, validated_strategy, ""
 
 
+    def submit_mutation_strategy(self, logs, test_case_str, execution_order_str, max_retries=3):
+        """在后台事件循环中发起请求，立即返回 concurrent.futures.Future"""
+        self.partial_strategy = {}
+        return asyncio.run_coroutine_threadsafe(
+            self.get_mutation_strategy_async(logs, test_case_str, execution_order_str, max_retries),
+            _background_loop()
+        )
+
     def get_mutation_strategy(self, logs, test_case_str, execution_order_str, max_retries=3):
+        """同步接口：等待后台请求完成并返回策略"""
+        return self.submit_mutation_strategy(logs, test_case_str, execution_order_str, max_retries).result()
+
+    def _load_cached_strategy(self, cache_key):
+        # 缓存读取失败（如 sqlite 错误）按未命中处理，不应中断模糊测试
+        try:
+            return self._cache.get(cache_key)
+        except Exception as e:
+            print(f"Failed to read mutation strategy cache: {e}")
+            return None
+
+    def _store_cached_strategy(self, cache_key, strategy):
+        # 缓存写入失败不影响本次结果，也不应触发重新请求
+        try:
+            self._cache.set(cache_key, strategy)
+        except Exception as e:
+            print(f"Failed to write mutation strategy cache: {e}")
+
+    async def _read_stream(self, stream):
+        """边接收边解析顶层的 函数名 -> 参数列表，更新 partial_strategy；返回完整响应文本"""
+        reader = _CompletionStreamReader(stream)
+        if IJSON_AVAILABLE:
+            strategy = {}
+            try:
+                async for func_name, params in ijson.kvitems_async(reader, '', use_float=True):
+                    strategy[func_name] = params
+                    self.partial_strategy = dict(strategy)
+            except ijson.JSONError:
+                # 非严格 JSON（例如带代码块标记），等完整文本到达后再统一解析
+                pass
+        await reader.drain()
+        return reader.text
+
+    async def get_mutation_strategy_async(self, logs, test_case_str, execution_order_str, max_retries=3):
         is_valid = False
         mutation_info = {}
         remind = "" 
-        
-        for _ in range(max_retries):            
-            prompt = f"""I am conducting fuzz testing on a smart contract and need suggestions on which parameters of multiple state functions should be mutated based on execution logs.
+        # 与重试无关的部分只构建一次：动态的执行信息 + __init__ 中预先构建的静态部分
+        prompt_head = f"""I am conducting fuzz testing on a smart contract and need suggestions on which parameters of multiple state functions should be mutated based on execution logs.
 
             The logs from a recent contract execution are: {logs}.
             The functions within the contract were executed in the following order: {execution_order_str}.
             The current test case that was used to trigger this execution sequence is as follows: {test_case_str}.
             The smart contract is as follows: 
-            {self.contract_source}
-
-            Please use the exact parameter names from the following state functions to provide mutation suggestions.
-            State functions and their parameters are as follows: {self.state_functions}.
-    
-            Based on the analysis of the execution trace and contract logic, please identify the function parameters that are the **most promising targets for mutation** to discover new behaviors or vulnerabilities.
-
-            Your result should be a JSON object where the key is the function name and the value is a list of parameter names that should be prioritized for mutation.
-
-            Example format:
-            {{
-                "transfer": ["amount"],
-                "approve": ["spender", "amount"],
-                "withdraw": [] 
-            }}
-
-            Only list the parameters that you have a high confidence will be impactful. If no parameters in a function are promising, provide an empty list.
             """
+        base_prompt = prompt_head + self._prompt_body
 
-
+        # 相同合约 + 相同函数执行序列时直接复用之前的策略
+        cache_key = None
+        if self._cache is not None:
+            key_hash = self._cache_key_prefix.copy()
+            key_hash.update(str(execution_order_str).encode("utf-8"))
+            cache_key = key_hash.hexdigest()
+            cached = self._load_cached_strategy(cache_key)
+            if cached is not None:
+                return cached
+        
+        for _ in range(max_retries):            
+            prompt = base_prompt
             
             # **关键部分**：如果不是第一次尝试，就向LLM提供具体的修正指令
             if remind:
                 prompt += f"\nIMPORTANT: Your previous response had errors. Please correct them. Here are the issues I found: {remind}"
     
+            self.partial_strategy = {}
             try:
-                response = self.client.chat.completions.create(
+                stream = await self.client.chat.completions.create(
                     model="deepseek-chat",
                     messages=[
                         {"role": "system", 
@@ -200,11 +414,15 @@ class LLMMutator:
                         {"role": "user", "content": prompt}
                     ],
                     temperature=0.8,
-                    response_format={"type": "json_object"} 
+                    response_format={"type": "json_object"},
+                    stream=True
                 )
-                content = response.choices[0].message.content
+                content = await self._read_stream(stream)
 
-                return json.loads(content)
+                strategy = _loads(content)
+                if cache_key is not None and strategy:
+                    self._store_cached_strategy(cache_key, strategy)
+                return strategy
                 
                 # 3. 验证并解析反馈
                 is_valid, mutation_info, error_message = self._validate_and_parse_feedback(content)
@@ -4,9 +4,21 @@
 ''' Mutation implementation. '''
 
 import random
+import copy
 import os
 import json
 import datetime
+import functools
+from dataclasses import dataclass
+
+from eth_hash.auto import keccak
+
+# 可选: numpy 用于批量生成变异掷币结果，减少逐次调用 random.random 的解释器开销
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
 
 from utils import settings
 from utils.utils import get_interface_from_abi
@@ -14,7 +26,39 @@ from utils.utils import get_interface_from_abi
 from ...plugin_interfaces.operators.mutation import Mutation
 from .llm_mutator import LLMMutator
 
-from web3 import Web3
+@dataclass
+class FuncInfo:
+    """ABI 中单个函数的信息: 函数名与参数名元组"""
+    __slots__ = ("name", "params")
+    name: str
+    params: tuple
+
+@functools.lru_cache(maxsize=None)
+def _function_info_map_cached(functions):
+    """按 ABI 中函数条目的元组表示缓存 function_hash -> 函数信息 的映射（返回值为共享对象，不要修改）"""
+    function_info_map = {}
+    for func_name, input_types, param_names in functions:
+        # 构建函数签名，例如 "transfer(address,uint256)"，计算标准的4字节函数选择器 (带 0x 前缀)
+        signature_text = f"{func_name}({','.join(input_types)})"
+        func_hash = '0x' + keccak(signature_text.encode())[:4].hex()
+        function_info_map[func_hash] = FuncInfo(func_name, param_names)
+    return function_info_map
+
+# get_else_mutation_info 中每个 gene 需要的掷币次数: account, amount, gaslimit, timestamp, blocknumber, balance
+ELSE_MUTATION_FLIPS = 6
+# 按地址存储的全局状态字段，已存在的每个地址各需一次掷币
+GLOBAL_STATE_MAPS = ("call_return", "extcodesize", "returndatasize")
+# 掷币数少于该值时 numpy 的调用开销高于逐次调用 random.random，直接用后者
+NUMPY_MIN_FLIPS = 32
+# 每个 (function_hash, 参数位置) 预采样值池的容量，池满后直接从池中均匀抽取
+ARGUMENT_POOL_SIZE = 64
+
+def mutate_one(args):
+    """进程池入口: 在子进程中对单个个体执行基础变异，args = (pm, individual, seed)"""
+    pm, individual, seed = args
+    # 每个任务使用独立的种子，避免 fork 出的子进程共享相同的随机数状态
+    random.seed(seed)
+    return Mutation(pm).baseline_mutation(individual)
 
 class Mutation(Mutation):
     def __init__(self, pm, mode='baseline'):
@@ -30,9 +74,15 @@ class Mutation(Mutation):
         self.llm_mutator = None
         self._llm_mutation_strategy = None 
         self._strategy_generation = -1 # 记录策略是为哪一代生成的，避免使用过时的策略
+        self._llm_future = None # 在途的 LLM 请求（同一时间至多一个），在后台事件循环中执行
         self.contract_abi = None 
 
         self.function_info_map = None # 第三次实验pool添加
+        self._rng = None # numpy 随机数生成器，首次使用时由 random 播种以保持可复现
+        self._targets_source = None # 生成 _target_masks 时使用的 LLM 策略对象
+        self._target_masks = {} # {function_hash: (参数是否为 LLM 目标, ...)}
+        self._argument_pools = {} # {(function_hash, 参数位置): [预采样的参数值, ...]}，每代清空
+        self._pool_generation = None
 
         # self.mutation_config = {
         #     'bit_flip_ratio': 0.8,  # 比特翻转概率
@@ -51,9 +101,42 @@ class Mutation(Mutation):
 
 
 
+    def _draw_flips(self, n):
+        """一次性生成 n 个掷币结果，每个为 True 的概率为 pm"""
+        if NUMPY_AVAILABLE and n >= NUMPY_MIN_FLIPS:
+            if self._rng is None:
+                self._rng = np.random.default_rng(random.getrandbits(64))
+            return (self._rng.random(n) <= self.pm).tolist()
+        rand = random.random
+        pm = self.pm
+        return [rand() <= pm for _ in range(n)]
+
+    def _else_flip_count(self, gene):
+        """get_else_mutation_info 对该 gene 需要的掷币次数: 固定字段 + 全局状态映射中已有的地址数"""
+        return ELSE_MUTATION_FLIPS + sum(len(gene.get(key) or ()) for key in GLOBAL_STATE_MAPS)
+
+    def _random_argument(self, generator, argument_type, function_hash, argument_index):
+        """从 (函数, 参数位置) 对应的值池中抽取参数；池未满时调用 generator 采样并加入池中"""
+        key = (function_hash, argument_index)
+        pool = self._argument_pools.get(key)
+        if pool is None:
+            pool = self._argument_pools[key] = []
+        if len(pool) < ARGUMENT_POOL_SIZE:
+            argument = generator.get_random_argument(argument_type, function_hash, argument_index)
+            # 数组类参数是可变对象，池中保存副本，避免与 gene 共享
+            pool.append(copy.deepcopy(argument) if isinstance(argument, (list, dict)) else argument)
+            return argument
+        argument = random.choice(pool)
+        return copy.deepcopy(argument) if isinstance(argument, (list, dict)) else argument
+
     def mutate(self, individual, engine):
         # analysis后面肯定要处理，只能是execution_trace_analysis
 
+        # 参数值池只在同一代内复用，进入新的一代时清空
+        if self._pool_generation != engine.current_generation:
+            self._argument_pools.clear()
+            self._pool_generation = engine.current_generation
+
         # 根据模式决定是否使用 LLM 变异
         use_llm_mutation = self.mode in ['llm-mutate', 'llm-full']
 
@@ -63,22 +146,36 @@ class Mutation(Mutation):
             # 2. 检查是否有新覆盖的“英雄”个体信息
             #    并且检查当前代数，确保只在发现新覆盖的那一代请求一次LLM
             if hasattr(engine.analysis[0].env, 'llm_amplifier_context') and self._strategy_generation != engine.current_generation: # ?
-                engine.logger.info("New coverage detected! Triggering LLM amplifier for mutation...")   
+                # 在代边界提交请求，不在此处等待结果；上一个请求仍在途时不重复提交
+                if self._llm_future is None:
+                    engine.logger.info("New coverage detected! Triggering LLM amplifier for mutation...")   
+                        
+                    hero_info = engine.analysis[0].env.llm_amplifier_context
                     
-                hero_info = engine.analysis[0].env.llm_amplifier_context
-                
-                # 假设合约源码在env中 # contract_source = engine.analysis[0].env.contract_source_code # 8-19 源码不好搞，决定改为abi
+                    # 假设合约源码在env中 # contract_source = engine.analysis[0].env.contract_source_code # 8-19 源码不好搞，决定改为abi
 
-                self._llm_mutation_strategy = self.llm_mutator.get_mutation_strategy(
-                    hero_info.get("logs", "No logs available"), 
-                    hero_info.get("test_case_str", ""),
-                    hero_info.get("order", "Unknown order")
-                )
+                    self._llm_future = self.llm_mutator.submit_mutation_strategy(
+                        hero_info.get("logs", "No logs available"), 
+                        hero_info.get("test_case_str", ""),
+                        hero_info.get("order", "Unknown order")
+                    )
 
                 self._strategy_generation = engine.current_generation
             elif not hasattr(engine.analysis[0].env, 'llm_amplifier_context'):
-                # 如果没有新覆盖，就清除旧策略
+                # 如果没有新覆盖，就清除旧策略，并丢弃在途请求的结果
                 self._llm_mutation_strategy = None
+                if self._llm_future is not None:
+                    self._llm_future.cancel()
+                    self._llm_future = None
+
+            # 请求完成后再切换策略；在此之前使用流式响应中已到达的部分策略，
+            # 若还没有则沿用上一个策略（或退回基础变异）
+            if self._llm_future is not None:
+                if self._llm_future.done():
+                    self._llm_mutation_strategy = self._llm_future.result()
+                    self._llm_future = None
+                elif self.llm_mutator.partial_strategy:
+                    self._llm_mutation_strategy = self.llm_mutator.partial_strategy
 
         # 完善数据结构：在变异逻辑的最开始，确保映射已经构建
         if self.function_info_map is None:
@@ -91,27 +188,64 @@ class Mutation(Mutation):
             return self.llm_guided_mutation(individual, self._llm_mutation_strategy)
 
         else:
-            for gene in individual.chromosome:
-                # TRANSACTION
-                function_hash = gene["arguments"][0]
-                for element in gene:
-                    if element != "account" and element != "amount" and element != "gaslimit":
-                        for argument_index in range(1, len(gene["arguments"])):
-                            if random.random() > self.pm:
-                                continue
-                            argument_type = individual.generator.interface[function_hash][argument_index - 1]
-                            argument = individual.generator.get_random_argument(argument_type,
-                                                                                function_hash,
-                                                                                argument_index - 1)
-                            gene["arguments"][argument_index] = argument
-
-                self.get_else_mutation_info(individual=individual, gene=gene)
-
-            individual.solution = individual.decode()
-            return individual
-
-
-    def get_else_mutation_info(self, individual, gene):
+            return self.baseline_mutation(individual)
+
+
+    def baseline_mutation(self, individual):
+        """Confuzzius 原有的随机变异：每个参数以及其他字段以概率 pm 重新采样"""
+        # 预先算出整个个体需要的掷币次数并一次性生成: 每个参数一次，外加 get_else_mutation_info 所需
+        num_arguments = sum(len(gene["arguments"]) - 1 for gene in individual.chromosome)
+        else_counts = [self._else_flip_count(gene) for gene in individual.chromosome]
+        flips = self._draw_flips(num_arguments + sum(else_counts))
+        pos = 0
+
+        for gene, else_count in zip(individual.chromosome, else_counts):
+            # TRANSACTION
+            function_hash = gene["arguments"][0]
+            for argument_index in range(1, len(gene["arguments"])):
+                flip = flips[pos]
+                pos += 1
+                if not flip:
+                    continue
+                argument_type = individual.generator.interface[function_hash][argument_index - 1]
+                argument = self._random_argument(individual.generator,
+                                                 argument_type,
+                                                 function_hash,
+                                                 argument_index - 1)
+                gene["arguments"][argument_index] = argument
+
+            self.get_else_mutation_info(individual=individual, gene=gene,
+                                        flips=flips[pos:pos + else_count])
+            pos += else_count
+
+        individual.solution = individual.decode()
+        return individual
+
+
+    def mutate_population(self, population, engine, executor=None):
+        """变异整个种群。
+
+        基础模式下各个体相互独立，可传入调用方管理生命周期的 executor（如 ProcessPoolExecutor）并行执行:
+
+            with ProcessPoolExecutor() as executor:
+                mutation.mutate_population(population, engine, executor)
+
+        每个任务都会把个体连同 individual.generator 一起 pickle 发送到子进程，结果再 pickle 回来，
+        只有单个个体的变异开销明显大于这部分序列化开销时才值得并行。
+        未传入 executor、LLM 模式（以等待网络为主且依赖共享的策略状态）或种群过小时，逐个串行调用 mutate。
+        """
+        if executor is None or self.mode in ['llm-mutate', 'llm-full'] or len(population) < 2:
+            return [self.mutate(individual, engine) for individual in population]
+
+        jobs = [(self.pm, individual, random.getrandbits(64)) for individual in population]
+        # 子进程返回的是副本，把结果写回原个体，保持引擎持有的对象不变
+        for individual, mutated in zip(population, executor.map(mutate_one, jobs)):
+            individual.chromosome = mutated.chromosome
+            individual.solution = mutated.solution
+        return population
+
+
+    def get_else_mutation_info(self, individual, gene, flips=None):
         # for gene in individual.chromosome:
         #     # TRANSACTION
         #     function_hash = gene["arguments"][0]
@@ -133,68 +267,66 @@ class Mutation(Mutation):
         #                 gene["arguments"][argument_index] = argument
         
         # 除arguments外其他所有参数
+        # flips: 预先生成的 _else_flip_count(gene) 个掷币结果，未提供时在此一次性生成；
+        # 前 ELSE_MUTATION_FLIPS 个用于固定字段，其余依次用于全局状态映射中的各个地址
+        if flips is None:
+            flips = self._draw_flips(self._else_flip_count(gene))
         function_hash = gene["arguments"][0]
-        if "account" in gene and random.random() <= self.pm:
+        if "account" in gene and flips[0]:
             gene["account"] = individual.generator.get_random_account(function_hash)
-        elif "amount" in gene and random.random() <= self.pm:
+        elif "amount" in gene and flips[1]:
             gene["amount"] = individual.generator.get_random_amount(function_hash)
-        elif "gaslimit" in gene and random.random() <= self.pm:
+        elif "gaslimit" in gene and flips[2]:
             gene["gaslimit"] = individual.generator.get_random_gaslimit(function_hash)
 
         # BLOCK
         if "timestamp" in gene:
-            if random.random() <= self.pm:
+            if flips[3]:
                 gene["timestamp"] = individual.generator.get_random_timestamp(function_hash)
         else:
             gene["timestamp"] = individual.generator.get_random_timestamp(function_hash)
 
         if "blocknumber" in gene:
-            if random.random() <= self.pm:
+            if flips[4]:
                 gene["blocknumber"] = individual.generator.get_random_blocknumber(function_hash)
         else:
             gene["blocknumber"] = individual.generator.get_random_blocknumber(function_hash)
 
         # GLOBAL STATE
         if "balance" in gene:
-            if random.random() <= self.pm:
+            if flips[5]:
                 gene["balance"] = individual.generator.get_random_balance(function_hash)
         else:
             gene["balance"] = individual.generator.get_random_balance(function_hash)
 
-        if "call_return" in gene:
-            for address in gene["call_return"]:
-                if random.random() <= self.pm:
-                    gene["call_return"][address] = individual.generator.get_random_callresult(function_hash, address)
-        else:
-            gene["call_return"] = dict()
-            address, call_return_value = individual.generator.get_random_callresult_and_address(function_hash)
-            if address and address not in gene["call_return"]:
-                gene["call_return"][address] = call_return_value
-
-        if "extcodesize" in gene:
-            for address in gene["extcodesize"]:
-                if random.random() <= self.pm:
-                    gene["extcodesize"][address] = individual.generator.get_random_extcodesize(function_hash, address)
-        else:
-            gene["extcodesize"] = dict()
-            address, extcodesize_value = individual.generator.get_random_extcodesize_and_address(function_hash)
-            if address and address not in gene["extcodesize"]:
-                gene["extcodesize"][address] = extcodesize_value
-
-        if "returndatasize" in gene:
-            for address in gene["returndatasize"]:
-                if random.random() <= self.pm:
-                    gene["returndatasize"][address] = individual.generator.get_random_returndatasize(function_hash, address)
-        else:
-            gene["returndatasize"] = dict()
-            address, returndatasize_value = individual.generator.get_random_returndatasize_and_address(function_hash)
-            if address and address not in gene["returndatasize"]:
-                gene["returndatasize"][address] = returndatasize_value
+        generator = individual.generator
+        map_flips = iter(flips[ELSE_MUTATION_FLIPS:])
+        self._maybe_resample_map(gene, "call_return", function_hash, map_flips,
+                                 generator.get_random_callresult, generator.get_random_callresult_and_address)
+        self._maybe_resample_map(gene, "extcodesize", function_hash, map_flips,
+                                 generator.get_random_extcodesize, generator.get_random_extcodesize_and_address)
+        self._maybe_resample_map(gene, "returndatasize", function_hash, map_flips,
+                                 generator.get_random_returndatasize, generator.get_random_returndatasize_and_address)
 
         # individual.solution = individual.decode()
         # return individual
 
 
+    def _maybe_resample_map(self, gene, key, function_hash, flips, resample_fn, init_fn):
+        """按地址存储的全局状态 (call_return/extcodesize/returndatasize):
+        已存在时每个地址以概率 pm 重新采样（依次消耗 flips 迭代器中的掷币结果），否则随机初始化一个地址"""
+        if key in gene:
+            mapping = gene[key]
+            if mapping:
+                for address, flip in zip(mapping, flips):
+                    if flip:
+                        mapping[address] = resample_fn(function_hash, address)
+        else:
+            gene[key] = mapping = dict()
+            address, value = init_fn(function_hash)
+            if address and address not in mapping:
+                mapping[address] = value
+
     def llm_guided_mutation(self, individual, llm_targets):
         """
         一个新的、由LLM指导的混合变异函数。
@@ -205,9 +337,21 @@ class Mutation(Mutation):
         # 定义两种变异概率
         high_priority_pm = 0.8  # LLM 目标的变异概率
         background_pm = self.pm # Confuzzius 原有的背景变异概率
+        rand = random.random    # 热循环中避免重复的属性查找
+
+        # 策略变化时重新构建每个函数的目标参数掩码
+        if llm_targets is not self._targets_source:
+            self._build_target_masks(llm_targets)
+
+        # get_else_mutation_info 的掷币结果按整个个体一次性生成，每个 gene 占 _else_flip_count(gene) 个
+        else_counts = [self._else_flip_count(gene) for gene in individual.chromosome]
+        else_flips = self._draw_flips(sum(else_counts))
+        pos = 0
 
         # 遍历测试用例中的每一笔交易 (gene)
-        for gene in individual.chromosome:
+        for gene, else_count in zip(individual.chromosome, else_counts):
+            gene_flips = else_flips[pos:pos + else_count]
+            pos += else_count
             function_hash = gene["arguments"][0]
             # 从 hash 获取函数名和参数名列表 (这需要一个辅助函数)
             # 从预先构建的映射中安全地查找函数信息，不再有任何假设
@@ -217,12 +361,10 @@ class Mutation(Mutation):
 
             
             func_info = self.function_info_map[function_hash]
-            func_name = func_info["name"]
-            param_names = func_info["params"]
-
-            # 检查当前函数是否是 LLM 的目标
-            is_targeted_function = func_name in llm_targets
-            targeted_params = llm_targets.get(func_name, [])
+            func_name = func_info.name
+            param_names = func_info.params
+            # 当前函数每个参数是否是 LLM 的目标
+            target_mask = self._target_masks[function_hash]
 
             # --- 1. 变异交易参数 (Arguments) ---
             for i in range(1, len(gene["arguments"])):
@@ -231,29 +373,46 @@ class Mutation(Mutation):
                 if param_index >= len(param_names):
                     break 
                 
-                param_name = param_names[param_index]
+                is_target = target_mask[param_index]
                 
                 # 决定使用哪个概率
-                current_pm = high_priority_pm if is_targeted_function and param_name in targeted_params else background_pm
+                current_pm = high_priority_pm if is_target else background_pm
                 
-                if random.random() <= current_pm:
-                    if is_targeted_function and param_name in targeted_params:
-                        print(f"  [LLM-GUIDED] Mutating targeted parameter '{param_name}' in function '{func_name}'")
+                if rand() <= current_pm:
+                    if is_target:
+                        print(f"  [LLM-GUIDED] Mutating targeted parameter '{param_names[param_index]}' in function '{func_name}'")
                     
                     # **核心：复用 Confuzzius 的 generator！**
                     argument_type = individual.generator.interface[function_hash][param_index]
-                    new_argument = individual.generator.get_random_argument(argument_type,
-                                                                            function_hash,
-                                                                            param_index)
+                    new_argument = self._random_argument(individual.generator,
+                                                         argument_type,
+                                                         function_hash,
+                                                         param_index)
                     gene["arguments"][i] = new_argument
 
 
-            self.get_else_mutation_info(individual=individual, gene=gene)
+            self.get_else_mutation_info(individual=individual, gene=gene, flips=gene_flips)
 
         individual.solution = individual.decode()
         return individual
 
 
+    def _build_target_masks(self, llm_targets):
+        """将 LLM 策略转换为 {函数名: frozenset(参数名)}，再按 function_info_map 展开为每个函数的参数掩码"""
+        target_sets = {}
+        if isinstance(llm_targets, dict):
+            for func_name, params in llm_targets.items():
+                if isinstance(params, str):
+                    params = [params]
+                elif not isinstance(params, (list, tuple)):
+                    params = []
+                target_sets[func_name] = frozenset(p for p in params if isinstance(p, str))
+        self._target_masks = {
+            func_hash: tuple(p in target_sets.get(info.name, ()) for p in info.params)
+            for func_hash, info in self.function_info_map.items()
+        }
+        self._targets_source = llm_targets
+
     def _build_function_info_map(self, abi):
         """
         遍历 self.abi 构建一个从 function_hash 到函数详细信息的映射。
@@ -261,38 +420,15 @@ class Mutation(Mutation):
         
         返回的映射结构:
         {
-            '0xa9059cbb': {'name': 'transfer', 'params': ['_to', '_value']},
-            '0x095ea7b3': {'name': 'approve', 'params': ['_spender', '_value']}
+            '0xa9059cbb': FuncInfo(name='transfer', params=('_to', '_value')),
+            '0x095ea7b3': FuncInfo(name='approve', params=('_spender', '_value'))
         }
         """
-        function_info_map = {}
-
-        for entry in abi:
-            # 我们只关心类型为 'function' 的条目
-            if entry.get('type') == 'function':
-                func_name = entry['name']
-                
-                # 提取参数类型和参数名
-                input_types = [inp['type'] for inp in entry['inputs']]
-                param_names = [inp['name'] for inp in entry['inputs']]
-                
-                # 构建函数签名，例如 "transfer(address,uint256)"
-                signature_text = f"{func_name}({','.join(input_types)})"
-                
-                # 计算标准的4字节函数选择器 (hash)
-                # Web3.keccak(text=...) 是计算Keccak-256哈希的标准方法
-                # [:10] 获取 '0x' 加上前4个字节 (8个十六进制字符)
-                # func_hash = Web3.keccak(text=signature_text).hex()[:10]
-                # func_hash = Web3.keccak(text=signature_text.encode("utf-8")).hex()[:10]
-                w3 = Web3()
-                func_hash = w3.sha3(text=signature_text).hex()[2:10]
-
-                normalized_func_hash = f"0x{func_hash}" if not func_hash.startswith("0x") else func_hash
-                
-                # 存储到映射中
-                function_info_map[normalized_func_hash] = {
-                    "name": func_name,
-                    "params": param_names
-                }
-                
-        return function_info_map
\ No newline at end of file
+        # 我们只关心类型为 'function' 的条目；转换为可哈希的元组后按 ABI 缓存
+        functions = tuple(
+            (entry['name'],
+             tuple(inp['type'] for inp in entry['inputs']),
+             tuple(inp['name'] for inp in entry['inputs']))
+            for entry in abi if entry.get('type') == 'function'
+        )
+        return _function_info_map_cached(functions)